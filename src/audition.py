@@ -0,0 +1,195 @@
+"""Gapless Audition Module"""
+
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional, Tuple
+import numpy as np
+import pygame
+from config import FADE_OUT_MS, AUDITION_QUEUE_SIZE
+from player import render_excerpt
+
+
+class AuditionQueue:
+    """Plays a continuous, crossfaded stream of excerpts through one mixer channel."""
+
+    def __init__(self,
+                 next_excerpt: Callable[[], Tuple[str, float, float]],
+                 queue_size: int = AUDITION_QUEUE_SIZE):
+        # next_excerpt returns (file_path, start, end) for the next excerpt to render
+        self.next_excerpt = next_excerpt
+        self.queue_size = queue_size
+        self.ring: deque = deque()
+        self.ring_changed = threading.Condition()
+        self.running: bool = False
+        self.stop_event: threading.Event = threading.Event()
+        # set when the renderer gives up (nothing left to pick), playback ends once the ring drains
+        self.render_done: threading.Event = threading.Event()
+        self.channel: Optional[pygame.mixer.Channel] = None
+        self.volume: float = 0.75
+
+        self.queued: dict = {}
+        self.current_info: dict = {}
+        self.threads: list[threading.Thread] = []
+
+    def start(self, volume: float = 0.75) -> None:
+        """
+        Start rendering ahead and feeding the mixer channel.
+
+        Args:
+            volume: Channel volume 0.0 - 1.0
+        """
+        if self.running:
+            return
+        self.running = True
+        self.stop_event = threading.Event()
+        self.render_done = threading.Event()
+        self.channel = pygame.mixer.find_channel(True)
+        self.set_volume(volume)
+
+        self.threads = [
+            threading.Thread(target=self._render_loop, args=(self.stop_event, self.render_done),
+                             name="audition-render", daemon=True),
+            threading.Thread(target=self._feed_loop, args=(self.stop_event, self.render_done),
+                             name="audition-feed", daemon=True),
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop playback and drop any rendered excerpts.
+        """
+        if not self.running:
+            return
+        self.running = False
+        with self.ring_changed:
+            # a render still in progress is dropped once it sees the event
+            self.stop_event.set()
+            self.ring.clear()
+            self.ring_changed.notify_all()
+        for thread in self.threads:
+            thread.join(timeout=1.0)
+        if self.channel is not None:
+            self.channel.stop()
+        self.queued.clear()
+        self.current_info = {}
+
+    def is_running(self) -> bool:
+        """
+        Check if audition mode is active.
+
+        Returns:
+            True if running, False otherwise
+        """
+        return self.running
+
+    def set_volume(self, volume: float) -> None:
+        """
+        Set channel volume.
+
+        Args:
+            volume: Volume 0.0 - 1.0
+        """
+        self.volume = max(0.0, min(1.0, volume))
+        if self.channel is not None:
+            self.channel.set_volume(self.volume)
+
+    def get_info(self) -> dict:
+        """
+        Get the excerpt currently being heard.
+
+        Returns:
+            Dict with file_path, start_time, end_time (empty if nothing yet)
+        """
+        if self.channel is not None:
+            sound = self.channel.get_sound()
+            if sound is not None and id(sound) in self.queued:
+                self.current_info = self.queued[id(sound)][1]
+        return self.current_info
+
+    def _render_loop(self, stop_event: threading.Event, render_done: threading.Event) -> None:
+        """Keep the ring buffer topped up with rendered excerpts."""
+        mix_rate = pygame.mixer.get_init()[0]
+        overlap = int(mix_rate * FADE_OUT_MS / 1000)
+        # tail of the last rendered excerpt, mixed into the head of the next one;
+        # local to this run so a renderer outliving stop() can't touch a new run's stream
+        tail: Optional[np.ndarray] = None
+
+        while not stop_event.is_set():
+            with self.ring_changed:
+                while not stop_event.is_set() and len(self.ring) >= self.queue_size:
+                    self.ring_changed.wait()
+            if stop_event.is_set():
+                break
+
+            try:
+                file_path, start, end = self.next_excerpt()
+            except ValueError as e:
+                # nothing to pick from (e.g. no file matches the filters), retrying won't help
+                print(f"Audition stopped: {e}")
+                render_done.set()
+                break
+            except Exception as e:
+                print(f"Audition pick failed: {e}")
+                time.sleep(0.5)
+                continue
+
+            try:
+                samples = render_excerpt(file_path, start, end, frame_rate=mix_rate)
+            except Exception as e:
+                print(f"Audition render failed: {e}")
+                time.sleep(0.5)
+                continue
+
+            samples, tail = crossfade(samples, tail, overlap)
+            info = {"file_path": file_path, "start_time": start, "end_time": end}
+
+            with self.ring_changed:
+                if stop_event.is_set():
+                    break
+                self.ring.append((pygame.mixer.Sound(buffer=samples.tobytes()), info))
+                self.ring_changed.notify_all()
+
+    def _feed_loop(self, stop_event: threading.Event, render_done: threading.Event) -> None:
+        """Queue the next rendered excerpt as soon as the channel has room."""
+        while not stop_event.is_set():
+            if self.channel.get_queue() is None and self.ring:
+                with self.ring_changed:
+                    if stop_event.is_set() or not self.ring:
+                        break
+                    sound, info = self.ring.popleft()
+                    self.ring_changed.notify_all()
+
+                # keep references alive until the mixer is done with them
+                self.queued = {key: value for key, value in self.queued.items()
+                               if value[0] in (self.channel.get_sound(), self.channel.get_queue())}
+                self.queued[id(sound)] = (sound, info)
+                self.channel.queue(sound)
+            elif render_done.is_set() and not self.ring and not self.channel.get_busy():
+                # everything rendered has played
+                self.running = False
+                break
+            time.sleep(0.02)
+
+
+def crossfade(samples: np.ndarray, tail: Optional[np.ndarray],
+              overlap: int) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Mix the previous excerpt's faded-out tail into this excerpt's faded-in head,
+    and hold back this excerpt's tail for the next one.
+
+    Args:
+        samples: int16 samples of the new excerpt
+        tail: Held back tail of the previous excerpt, or None
+        overlap: Frames to overlap
+
+    Returns:
+        Tuple of (samples to queue, tail to mix into the next excerpt)
+    """
+    if len(samples) <= 2 * overlap:
+        return samples, tail
+    mixed = samples[:-overlap].astype(np.int32)
+    if tail is not None:
+        mixed[:overlap] += tail
+    return np.clip(mixed, -32768, 32767).astype(np.int16), samples[-overlap:].astype(np.int32)
@@ -0,0 +1,81 @@
+"""Benchmark for excerpt rendering
+
+Compares the old pydub chain (full-track set_sample_width/set_frame_rate/
+set_channels, then slice and fade) against player.render_excerpt.
+
+Run with: python src/benchmark_player.py [audio file] [--start 30] [--length 8]
+With no file, a 3 minute 48 kHz mono test tone is generated.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+import soundfile as sf
+from pydub import AudioSegment
+from config import FADE_IN_MS, FADE_OUT_MS
+from player import render_excerpt
+
+
+def render_excerpt_pydub(file_path: str, start: float, end: float) -> np.ndarray:
+    """
+    The original conversion chain, for comparison.
+    """
+    audio = AudioSegment.from_file(file_path)
+    audio = audio.set_sample_width(2)
+    audio = audio.set_frame_rate(44100)
+    audio = audio.set_channels(2)
+    excerpt = audio[int(start * 1000):int(end * 1000)]
+    excerpt = excerpt.fade_in(FADE_IN_MS).fade_out(FADE_OUT_MS)
+    return np.array(excerpt.get_array_of_samples(), dtype=np.int16).reshape(-1, 2)
+
+def make_test_file() -> str:
+    """
+    Write a 3 minute 48 kHz mono file with a few tones and noise.
+    """
+    rate = 48000
+    t = np.arange(rate * 180) / rate
+    signal = 0.3 * np.sin(2 * np.pi * 220 * t) + 0.2 * np.sin(2 * np.pi * 331 * t)
+    signal += 0.05 * np.random.default_rng(0).standard_normal(len(t))
+    path = os.path.join(tempfile.mkdtemp(), "benchmark.wav")
+    sf.write(path, signal.astype(np.float32), rate, subtype="PCM_16")
+    return path
+
+def best_time(function, *args, repeats: int = 5) -> tuple[float, np.ndarray]:
+    """
+    Best wall time over a few runs, and the last result.
+    """
+    best = float("inf")
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def main():
+    """Run the benchmark and print timings and the difference between outputs."""
+    parser = argparse.ArgumentParser(description="Benchmark excerpt rendering")
+    parser.add_argument("file", nargs="?")
+    parser.add_argument("--start", type=float, default=30.0)
+    parser.add_argument("--length", type=float, default=8.0)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    file_path = args.file or make_test_file()
+    end = args.start + args.length
+
+    old_time, old = best_time(render_excerpt_pydub, file_path, args.start, end, repeats=args.repeats)
+    new_time, new = best_time(render_excerpt, file_path, args.start, end, repeats=args.repeats)
+
+    frames = min(len(old), len(new))
+    difference = np.abs(old[:frames].astype(np.int32) - new[:frames].astype(np.int32))
+    print(f"File: {file_path}")
+    print(f"pydub chain:   {old_time * 1000:8.1f} ms  ({len(old)} frames)")
+    print(f"numpy render:  {new_time * 1000:8.1f} ms  ({len(new)} frames)")
+    print(f"Speedup: {old_time / new_time:.1f}x")
+    print(f"Max sample difference: {difference.max()} (mean {difference.mean():.2f}) of 32768")
+
+if __name__ == "__main__":
+    main()
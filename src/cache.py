@@ -2,9 +2,38 @@
 
 import json
 import os
+import tempfile
+import threading
 from pathlib import Path
-from typing import Optional
-from config import CACHE_FILE
+from typing import Callable, Optional
+from config import CACHE_FILE, ONSET_DETECTORS, CACHE_FLUSH_INTERVAL
+
+CACHE_SCHEMA_VERSION = 2
+
+# what the original flat (v1) cache was computed with, stamped on entries when migrating
+V1_DETECTORS = {
+    "librosa": {"version": "1", "params": {"hop_length": 512, "backtrack": True}},
+    "inhouse": {"version": "1",
+                "params": {"frame_size": 2048, "hop_size": 512, "threshold_factor": 1.25}},
+}
+
+# onset lookups, this session and loaded from previous sessions
+_stats = {"hits": 0, "misses": 0}
+_lifetime_stats = {"hits": 0, "misses": 0}
+
+# last good copy of the cache file, kept so a crash mid-save never loses everything
+BACKUP_FILE = CACHE_FILE + ".bak"
+
+# guards the cache dict between the menu, background workers and the autosave thread
+_lock = threading.RLock()
+# serializes whole saves (write, rotate, replace) so overlapping saves can't swap files under each other
+_save_lock = threading.Lock()
+_dirty = False
+_autosave_stop: Optional[threading.Event] = None
+_autosave_thread: Optional[threading.Thread] = None
+
+# called with a file path whenever that file's entry changes (e.g. to keep the library table current)
+_listeners: list[Callable[[str], None]] = []
 
 def load_cache() -> dict:
     """
@@ -13,28 +42,181 @@ def load_cache() -> dict:
     Returns:
         Dictionary mapping file paths to onset data
     """
-    if Path(CACHE_FILE).exists():
-        try:
-            with open(CACHE_FILE, 'r', encoding="UTF8") as f:
-                return json.load(f)
-        except json.JSONDecodeError:
-            print("Cache file corrupted")
-            return {}
-    else:
+    data = _read_cache_file(CACHE_FILE)
+    if data is None and Path(BACKUP_FILE).exists():
+        data = _read_cache_file(BACKUP_FILE)
+        if data is not None:
+            print("Recovered cache from backup")
+    if data is None:
         return {}
+    return _unpack_cache(data)
+
+def _read_cache_file(path: str) -> Optional[dict]:
+    """
+    Read one cache file, setting it aside if it is corrupted or
+    written in a schema this version doesn't know.
+    """
+    if not Path(path).exists():
+        return None
+    try:
+        with open(path, 'r', encoding="UTF8") as f:
+            data = json.load(f)
+        if not isinstance(data, dict):
+            raise ValueError("not a JSON object")
+    except (ValueError, UnicodeDecodeError):
+        print(f"Cache file {path} corrupted")
+        # keep it out of the way so the next save doesn't rotate it into the backup
+        os.replace(path, path + ".corrupt")
+        return None
+
+    # v1 files have no schema key at all
+    schema = data.get("schema", 1)
+    if schema not in (1, CACHE_SCHEMA_VERSION):
+        print(f"Cache file {path} has unsupported schema {schema}, setting it aside")
+        # e.g. written by a newer version, keep it intact for that version
+        os.replace(path, f"{path}.schema{schema}")
+        return None
+    return data
+
+def _unpack_cache(data: dict) -> dict:
+    """
+    Pull entries (and stored stats) out of the on-disk layout,
+    migrating the old flat path -> entry format.
+    """
+    if "schema" in data:
+        _lifetime_stats.update(data.get("stats", {}))
+        return data.get("entries", {})
+
+    # v1: the whole file is the entries dict
+    for file_dict in data.values():
+        detectors = file_dict.setdefault("detectors", {})
+        for algorithm, signature in V1_DETECTORS.items():
+            if f"onsets_{algorithm}" in file_dict:
+                detectors.setdefault(algorithm, {"name": algorithm, **signature})
+    return data
 
 def save_cache(cache: dict) -> None:
     """
-    Save onset cache to disk.
+    Save onset cache to disk atomically: write a temp file, keep the
+    previous file as a backup, then swap the new one in.
     
     Args:
         cache: Dictionary of onset data to save
     """
-    try:
-        with open(CACHE_FILE, 'w', encoding="UTF8") as f:
-            json.dump(cache, f, indent=2)
-    except Exception as e:
-        print(f"Failed to save cache: {e}")
+    global _dirty
+    with _save_lock:
+        temp_file = None
+        try:
+            with _lock:
+                data = {
+                    "schema": CACHE_SCHEMA_VERSION,
+                    "stats": {key: _lifetime_stats[key] + _stats[key] for key in _stats},
+                    "entries": cache,
+                }
+                text = json.dumps(data, separators=(",", ":"))
+                _dirty = False
+
+            # unique name, so another process saving the same cache can't clobber it
+            cache_dir = os.path.dirname(os.path.abspath(CACHE_FILE))
+            fd, temp_file = tempfile.mkstemp(prefix=os.path.basename(CACHE_FILE) + ".",
+                                             suffix=".tmp", dir=cache_dir)
+            with os.fdopen(fd, 'w', encoding="UTF8") as f:
+                f.write(text)
+                f.flush()
+                os.fsync(f.fileno())
+            if Path(CACHE_FILE).exists():
+                os.replace(CACHE_FILE, BACKUP_FILE)
+            os.replace(temp_file, CACHE_FILE)
+        except Exception as e:
+            mark_dirty()
+            print(f"Failed to save cache: {e}")
+            if temp_file is not None and Path(temp_file).exists():
+                os.remove(temp_file)
+
+def mark_dirty(*file_paths: str) -> None:
+    """
+    Flag the cache as changed since the last save, and tell
+    listeners which entries changed.
+    
+    Args:
+        file_paths: Paths whose entries were added/changed/removed
+    """
+    global _dirty
+    with _lock:
+        _dirty = True
+    for file_path in file_paths:
+        for listener in _listeners:
+            listener(file_path)
+
+def add_update_listener(listener: Callable[[str], None]) -> None:
+    """
+    Register a callback run with the file path each time an entry changes.
+    
+    Args:
+        listener: Callback taking a file path
+    """
+    _listeners.append(listener)
+
+def flush_cache(cache: dict) -> bool:
+    """
+    Save the cache only if it changed since the last save.
+    
+    Args:
+        cache: Dictionary of onset data to save
+        
+    Returns:
+        True if a save happened
+    """
+    if not _dirty:
+        return False
+    save_cache(cache)
+    return True
+
+def start_autosave(cache: dict, interval: float = CACHE_FLUSH_INTERVAL) -> None:
+    """
+    Flush the cache in the background every `interval` seconds.
+    
+    Args:
+        cache: Dictionary of onset data to save
+        interval: Seconds between flushes
+    """
+    global _autosave_stop, _autosave_thread
+    if _autosave_stop is not None:
+        return
+    _autosave_stop = threading.Event()
+
+    def autosave(stop: threading.Event) -> None:
+        while not stop.wait(interval):
+            flush_cache(cache)
+
+    _autosave_thread = threading.Thread(target=autosave, args=(_autosave_stop,),
+                                        name="cache-autosave", daemon=True)
+    _autosave_thread.start()
+
+def stop_autosave() -> None:
+    """
+    Stop the background flush thread, waiting for a flush in progress
+    so it can't finish after (and overwrite) a final save.
+    """
+    global _autosave_stop, _autosave_thread
+    if _autosave_stop is not None:
+        _autosave_stop.set()
+        _autosave_thread.join()
+        _autosave_stop = None
+        _autosave_thread = None
+
+def cached_paths(cache: dict) -> list[str]:
+    """
+    Copy of the cached file paths, safe to iterate while other threads add entries.
+    
+    Args:
+        cache: Current cache dictionary
+        
+    Returns:
+        List of file paths
+    """
+    with _lock:
+        return list(cache)
 
 def get_cached_onsets(file_path: str, cache: dict) -> Optional[dict]:
     """
@@ -65,6 +247,69 @@ def get_cached_onsets(file_path: str, cache: dict) -> Optional[dict]:
     except (FileNotFoundError, KeyError):
         return None
 
+def get_cached_onset_list(file_path: str, cache: dict, algorithm: str,
+                          count: bool = True) -> Optional[dict]:
+    """
+    Get cached data for a file only if it holds onsets from the current
+    version/params of the given detector. Counts hits and misses.
+    
+    Args:
+        file_path: Path to audio file
+        cache: Current cache dictionary
+        algorithm: Onset algorithm name
+        count: Count this lookup in the hit rate (False when the caller already did)
+        
+    Returns:
+        Cached data dict or None if invalid/missing/outdated
+    """
+    cached = get_cached_onsets(file_path, cache)
+    hit = (cached is not None and f"onsets_{algorithm}" in cached
+           and detector_is_current(cached, algorithm))
+    if count:
+        count_lookup(hit)
+    return cached if hit else None
+
+def count_lookup(hit: bool) -> None:
+    """
+    Record a cache lookup (onsets, or beats in beat mode) for the hit rate.
+    
+    Args:
+        hit: True if the cache had what was needed
+    """
+    with _lock:
+        _stats["hits" if hit else "misses"] += 1
+
+def detector_signature(algorithm: str, params: Optional[dict] = None) -> dict:
+    """
+    Describe an onset detector for storing alongside its results.
+    
+    Args:
+        algorithm: Onset algorithm name
+        params: Params used, defaults to the configured ones
+        
+    Returns:
+        Dict with name, version and params
+    """
+    detector = ONSET_DETECTORS[algorithm]
+    return {
+        "name": algorithm,
+        "version": detector["version"],
+        "params": dict(detector["params"] if params is None else params),
+    }
+
+def detector_is_current(file_dict: dict, algorithm: str) -> bool:
+    """
+    Check if an entry's onsets for an algorithm match the configured detector.
+    """
+    stored = file_dict.get("detectors", {}).get(algorithm)
+    return stored == detector_signature(algorithm)
+
+def record_detector(file_dict: dict, algorithm: str, params: Optional[dict] = None) -> None:
+    """
+    Stamp an entry with the detector that produced its onsets.
+    """
+    file_dict.setdefault("detectors", {})[algorithm] = detector_signature(algorithm, params)
+
 def update_cache(file_path: str, duration: float,
                   bpm: float, beats: list[float], 
                   cache: dict, 
@@ -81,20 +326,185 @@ def update_cache(file_path: str, duration: float,
     """
     current = os.path.getmtime(file_path)
 
-    if file_path in cache:
-        file_dict = cache[file_path]
-        file_dict["duration"] = duration
-        file_dict["bpm"] = bpm
-        file_dict["beats"] = beats
-        file_dict["last_modified"] = current
-    else:
-        file_dict = {
-            "duration": duration,
-            "beats": beats,
-            "last_modified": current,
-            "bpm": bpm
+    with _lock:
+        if file_path in cache:
+            file_dict = cache[file_path]
+            file_dict["duration"] = duration
+            file_dict["bpm"] = bpm
+            file_dict["beats"] = beats
+            file_dict["last_modified"] = current
+        else:
+            file_dict = {
+                "duration": duration,
+                "beats": beats,
+                "last_modified": current,
+                "bpm": bpm
+            }
+
+        file_dict[f"onsets_{algorithm}"] = onsets
+        record_detector(file_dict, algorithm)
+
+        cache[file_path] = file_dict
+    mark_dirty(file_path)
+
+def update_onsets(file_path: str, cache: dict, onsets: list[float], algorithm: str) -> bool:
+    """
+    Replace one onset list on an existing entry (e.g. re-derived from a
+    stored curve), stamped with the configured detector.
+    
+    Args:
+        file_path: Path to audio file
+        cache: Cache dictionary to update
+        onsets: List of onset times in seconds
+        algorithm: Onset algorithm the list came from
+        
+    Returns:
+        True if the entry existed and was updated
+    """
+    with _lock:
+        file_dict = cache.get(file_path)
+        if file_dict is None:
+            return False
+        file_dict[f"onsets_{algorithm}"] = onsets
+        record_detector(file_dict, algorithm)
+    mark_dirty(file_path)
+    return True
+
+def update_metadata(file_path: str, cache: dict, **fields) -> None:
+    """
+    Set fields (duration, samplerate, beats...) on a file's entry without
+    touching its onsets. An entry for an older version of the file is
+    replaced, so its results can't be mistaken for current ones.
+    
+    Args:
+        file_path: Path to audio file
+        cache: Cache dictionary to update
+        fields: Values to store on the entry
+    """
+    current = os.path.getmtime(file_path)
+
+    with _lock:
+        file_dict = cache.get(file_path)
+        if file_dict is None or file_dict.get("last_modified") != current:
+            file_dict = {"last_modified": current}
+        file_dict.update(fields)
+        cache[file_path] = file_dict
+    mark_dirty(file_path)
+
+def prune_cache(cache: dict, root: Optional[str] = None) -> list[str]:
+    """
+    Remove entries whose files no longer exist.
+    
+    Args:
+        cache: Cache dictionary to prune
+        root: Only prune files under this folder, and only where the file's
+            own folder still exists (so an unmounted drive or a moved
+            folder doesn't wipe the cache). None prunes every missing file.
+        
+    Returns:
+        List of removed file paths
+    """
+    def missing(file_path: str) -> bool:
+        if os.path.exists(file_path):
+            return False
+        if root is None:
+            return True
+        path = Path(file_path)
+        return path.is_relative_to(root) and path.parent.is_dir()
+
+    with _lock:
+        removed = [file_path for file_path in cache if missing(file_path)]
+        for file_path in removed:
+            del cache[file_path]
+    if removed:
+        mark_dirty(*removed)
+    return removed
+
+def compact_cache(cache: dict) -> int:
+    """
+    Drop results that would be recomputed anyway: whole entries for modified
+    files and onset lists from outdated detector versions/params.
+    
+    Args:
+        cache: Cache dictionary to compact
+        
+    Returns:
+        Number of entries and onset lists removed
+    """
+    removed = 0
+    changed = []
+    with _lock:
+        for file_path in list(cache):
+            if get_cached_onsets(file_path, cache) is None:
+                del cache[file_path]
+                removed += 1
+                changed.append(file_path)
+                continue
+
+            file_dict = cache[file_path]
+            for algorithm in ONSET_DETECTORS:
+                key = f"onsets_{algorithm}"
+                if key in file_dict and not detector_is_current(file_dict, algorithm):
+                    del file_dict[key]
+                    file_dict.get("detectors", {}).pop(algorithm, None)
+                    removed += 1
+                    changed.append(file_path)
+    if removed:
+        mark_dirty(*changed)
+    return removed
+
+def cache_stats(cache: dict) -> dict:
+    """
+    Report cache size and onset lookup hit rate.
+    
+    Args:
+        cache: Current cache dictionary
+        
+    Returns:
+        Dict with entries, onset list counts, file size and hit rates
+        (None when there were no lookups yet)
+    """
+    with _lock:
+        lookups = _stats["hits"] + _stats["misses"]
+        total_hits = _lifetime_stats["hits"] + _stats["hits"]
+        total_lookups = total_hits + _lifetime_stats["misses"] + _stats["misses"]
+        entries = len(cache)
+        onset_lists = {
+            algorithm: sum(1 for file_dict in cache.values() if f"onsets_{algorithm}" in file_dict)
+            for algorithm in ONSET_DETECTORS
         }
+    return {
+        "entries": entries,
+        "onset_lists": onset_lists,
+        "file_bytes": os.path.getsize(CACHE_FILE) if Path(CACHE_FILE).exists() else 0,
+        "session_hit_rate": _stats["hits"] / lookups if lookups else None,
+        "lifetime_hit_rate": total_hits / total_lookups if total_lookups else None,
+    }
+
+def maintain_cache(cache: dict) -> dict:
+    """
+    Prune and compact the cache, then write it out compactly.
+    
+    Args:
+        cache: Cache dictionary to maintain
+        
+    Returns:
+        Dict with pruned and compacted counts
+    """
+    pruned = prune_cache(cache)
+    compacted = compact_cache(cache)
+    save_cache(cache)
+    return {"pruned": len(pruned), "compacted": compacted}
 
-    file_dict[f"onsets_{algorithm}"] = onsets
+if __name__ == "__main__":
+    # python cache.py -> run maintenance on the cache file and the stores kept next to it
+    from feature_store import prune_features
+    from similarity import prune_windows
 
-    cache[file_path] = file_dict
\ No newline at end of file
+    entries = load_cache()
+    summary = maintain_cache(entries)
+    print(f"Pruned {summary['pruned']} missing files, "
+          f"removed {summary['compacted']} outdated results, "
+          f"{prune_features()} feature files, {prune_windows()} similarity windows")
+    for name, value in cache_stats(entries).items():
+        print(f"{name}: {value}")
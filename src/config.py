@@ -11,3 +11,27 @@ CACHE_FILE = "onset_cache.json"
 EXPORTS_FOLDER = "./exports"
 FADE_IN_MS = 5
 FADE_OUT_MS = 10
+FEATURE_STORE_FOLDER = "./features"
+SAVE_FEATURES = False  # keep flux/onset strength curves so onsets can be re-tuned without decoding
+FEATURE_DTYPE = "float32"  # "float16" halves the files, but re-derived onsets can then differ slightly from a fresh analysis
+EXPORT_FORMAT = "wav"  # wav, flac, ogg or mp3
+EXPORT_BIT_DEPTH = 16  # 16, 24 or 32 (float), ignored by ogg/mp3
+EXPORT_SAMPLE_RATE = None  # None keeps the excerpt's sample rate
+EXPORT_WORKERS = 2
+AUDITION_QUEUE_SIZE = 3  # excerpts rendered ahead in audition mode
+# onset detector versions/params, recorded per cache entry so a change only recomputes what it affects
+ONSET_DETECTORS = {
+    "librosa": {"version": "1", "params": {"hop_length": 512, "backtrack": True}},
+    "inhouse": {"version": "1",
+                "params": {"frame_size": 2048, "hop_size": 512, "threshold_factor": 1.25}},
+}
+CACHE_AUTO_PRUNE = True  # drop entries for missing files in MUSIC_FOLDER on startup (outdated onsets are dropped by cache maintenance)
+CACHE_FLUSH_INTERVAL = 30  # seconds between background saves of new analyses
+PROBE_ON_SCAN = True  # read duration/sample rate/channels from file headers for the whole library at startup
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8765
+SERVER_WORKERS = 4  # processes for analysis/decoding in server mode
+SIMILARITY_INDEX = False  # store a feature vector per excerpt window during beat analysis (adds ~0.5 s per new file)
+SIMILARITY_FOLDER = "./similarity"
+SIMILARITY_WINDOW_HOP = 4.0  # seconds between indexed window starts (windows are EXCERPT_LENGTH long)
+SIMILARITY_TOP_K = 5
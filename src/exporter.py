@@ -1,13 +1,35 @@
 """Exporting File Module"""
 
+import shutil
+import subprocess
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
+from typing import Optional
+import numpy as np
+import soundfile as sf
+import soxr
 from player import ExcerptPlayer
+from config import EXPORT_FORMAT, EXPORT_BIT_DEPTH, EXPORT_SAMPLE_RATE, EXPORT_WORKERS
 
-def export_excerpt(player: ExcerptPlayer, output_folder: str) -> str:
+EXPORT_FORMATS = ("wav", "flac", "ogg", "mp3")
+PCM_SUBTYPES = {16: "PCM_16", 24: "PCM_24", 32: "FLOAT"}
+
+
+def export_excerpt(player: ExcerptPlayer, output_folder: str,
+                   fmt: str = EXPORT_FORMAT,
+                   bit_depth: int = EXPORT_BIT_DEPTH,
+                   sample_rate: Optional[int] = EXPORT_SAMPLE_RATE) -> str:
     """
     Export audio excerpt to file.
 
+    Args:
+        player: Player holding the current excerpt
+        output_folder: Folder to write into
+        fmt: One of EXPORT_FORMATS
+        bit_depth: 16, 24 or 32 (float) for wav/flac
+        sample_rate: Output rate, None keeps the excerpt's rate
         
     Returns:
         Path to exported file
@@ -15,28 +37,130 @@ def export_excerpt(player: ExcerptPlayer, output_folder: str) -> str:
     if player.current_audio is None:
         raise ValueError("No audio loaded")
     info = player.get_info()
-    filename = generate_export_filename(info["file_path"])
+    samples, samplerate = player.get_samples()
+    filename = generate_export_filename(info["file_path"], fmt)
     ensure_export_folder(output_folder)
     output_path = Path(output_folder) / filename
-    player.current_audio.export(output_path, format="wav")
+    return write_samples(samples, samplerate, output_path, fmt, bit_depth, sample_rate)
+
+def write_samples(samples: np.ndarray, samplerate: int, output_path: Path,
+                  fmt: str = EXPORT_FORMAT,
+                  bit_depth: int = EXPORT_BIT_DEPTH,
+                  sample_rate: Optional[int] = EXPORT_SAMPLE_RATE) -> str:
+    """
+    Write a float32 sample buffer straight to an audio file.
+
+    Args:
+        samples: Float samples shaped (frames, channels)
+        samplerate: Sample rate of the buffer
+        output_path: Destination file
+        fmt: One of EXPORT_FORMATS
+        bit_depth: 16, 24 or 32 (float) for wav/flac
+        sample_rate: Output rate, None keeps the buffer's rate
+
+    Returns:
+        Path to written file
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+
+    if sample_rate and sample_rate != samplerate:
+        samples = soxr.resample(samples, samplerate, sample_rate)
+        samplerate = sample_rate
+
+    if fmt == "mp3" and "MP3" not in sf.available_formats():
+        # older libsndfile builds can't encode mp3, hand it to ffmpeg
+        encode_mp3_ffmpeg(samples, samplerate, output_path)
+        return str(output_path)
+
+    if fmt == "ogg":
+        subtype = "VORBIS"
+    elif fmt == "mp3":
+        subtype = "MPEG_LAYER_III"
+    elif fmt == "flac" and bit_depth == 32:
+        # flac has no float subtype
+        subtype = "PCM_24"
+    else:
+        subtype = PCM_SUBTYPES.get(bit_depth, "PCM_16")
+
+    sf.write(output_path, samples, samplerate, subtype=subtype, format=fmt.upper())
     return str(output_path)
 
-def generate_export_filename(original_path: str) -> str:
+# one mp3 encode at a time so a queue of exports doesn't spawn a pile of ffmpegs
+_ffmpeg_lock = threading.Lock()
+
+def encode_mp3_ffmpeg(samples: np.ndarray, samplerate: int, output_path: Path) -> None:
+    """
+    Encode raw float samples to mp3 by piping them into ffmpeg (no temp wav).
+
+    Args:
+        samples: Float samples shaped (frames, channels)
+        samplerate: Sample rate of the buffer
+        output_path: Destination file
+    """
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        raise RuntimeError("FFmpeg not found, needed for mp3 export")
+
+    channels = samples.shape[1] if samples.ndim > 1 else 1
+    command = [
+        ffmpeg, "-y", "-loglevel", "error",
+        "-f", "f32le", "-ar", str(samplerate), "-ac", str(channels), "-i", "pipe:0",
+        "-codec:a", "libmp3lame", "-q:a", "2", str(output_path),
+    ]
+    data = np.ascontiguousarray(samples, dtype="<f4").tobytes()
+    with _ffmpeg_lock:
+        result = subprocess.run(command, input=data, capture_output=True, check=False)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {result.stderr.decode(errors='ignore').strip()}")
+
+class ExportQueue:
+    """Runs exports on background workers so the menu never blocks."""
+
+    def __init__(self, workers: int = EXPORT_WORKERS):
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="export")
+
+    def submit(self, player: ExcerptPlayer, output_folder: str,
+               fmt: str = EXPORT_FORMAT,
+               bit_depth: int = EXPORT_BIT_DEPTH,
+               sample_rate: Optional[int] = EXPORT_SAMPLE_RATE) -> Future:
+        """
+        Queue the player's current excerpt for export.
+        The samples are copied now, so loading a new excerpt is safe.
+
+        Returns:
+            Future resolving to the exported file path
+        """
+        if player.current_audio is None:
+            raise ValueError("No audio loaded")
+        info = player.get_info()
+        samples, samplerate = player.get_samples()
+        ensure_export_folder(output_folder)
+        output_path = Path(output_folder) / generate_export_filename(info["file_path"], fmt)
+        return self.pool.submit(write_samples, samples, samplerate, output_path,
+                                fmt, bit_depth, sample_rate)
+
+    def shutdown(self) -> None:
+        """
+        Wait for queued exports to finish.
+        """
+        self.pool.shutdown(wait=True)
+
+def generate_export_filename(original_path: str, fmt: str = "wav") -> str:
     """
     Generate descriptive filename for export.
-    Format: "originalname_0m23s-0m28s_timestamp.wav"
+    Format: "originalname_timestamp.ext"
     
     Args:
         original_path: Original file path
-        start: Start time
-        end: End time
+        fmt: Export format, used as extension
         
     Returns:
         Filename string
     """
 
     path_name = Path(original_path)
-    file_name = f"{path_name.stem}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.wav"
+    file_name = f"{path_name.stem}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.{fmt}"
     return file_name
 
 def ensure_export_folder(folder: str) -> None:
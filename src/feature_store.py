@@ -0,0 +1,107 @@
+"""Feature Store Module"""
+
+import hashlib
+import os
+from pathlib import Path
+from typing import Optional
+import numpy as np
+from config import FEATURE_STORE_FOLDER, FEATURE_DTYPE
+
+
+def feature_path(file_path: str, algorithm: str) -> Path:
+    """
+    Get the path of the stored feature curve for a file.
+
+    Args:
+        file_path: Path to audio file
+        algorithm: Onset algorithm the curve belongs to
+
+    Returns:
+        Path to the compressed .npz file
+    """
+    digest = hashlib.sha1(file_path.encode("UTF8")).hexdigest()
+    return Path(FEATURE_STORE_FOLDER) / f"{digest}_{algorithm}.npz"
+
+
+def save_features(file_path: str, algorithm: str, curve: np.ndarray,
+                  samplerate: int, hop_size: int) -> None:
+    """
+    Save an onset curve (spectral flux or onset strength) to disk.
+
+    Args:
+        file_path: Path to audio file
+        algorithm: Onset algorithm that produced the curve
+        curve: One value per analysis frame
+        samplerate: Sample rate the curve was computed at
+        hop_size: Hop size in samples between frames
+    """
+    try:
+        Path(FEATURE_STORE_FOLDER).mkdir(parents=True, exist_ok=True)
+        np.savez_compressed(
+            feature_path(file_path, algorithm),
+            curve=np.asarray(curve, dtype=FEATURE_DTYPE),
+            samplerate=int(samplerate),
+            hop_size=int(hop_size),
+            last_modified=os.path.getmtime(file_path),
+            source=file_path,
+        )
+    except OSError as e:
+        print(f"Failed to save features: {e}")
+
+
+def load_features(file_path: str, algorithm: str) -> Optional[dict]:
+    """
+    Load a stored onset curve if it is still valid for the file.
+
+    Args:
+        file_path: Path to audio file
+        algorithm: Onset algorithm the curve belongs to
+
+    Returns:
+        Dict with "curve" (float32), "samplerate" and "hop_size",
+        or None if missing/outdated
+    """
+    path = feature_path(file_path, algorithm)
+    if not path.exists():
+        return None
+
+    try:
+        with np.load(path) as data:
+            stored_time = float(data["last_modified"])
+            features = {
+                "curve": data["curve"].astype(np.float32),
+                "samplerate": int(data["samplerate"]),
+                "hop_size": int(data["hop_size"]),
+            }
+        if os.path.getmtime(file_path) != stored_time:
+            return None
+        return features
+    except FileNotFoundError:
+        return None
+    except (OSError, KeyError, ValueError):
+        print(f"Feature file {path} corrupted")
+        return None
+
+
+def prune_features() -> int:
+    """
+    Remove stored curves whose source file no longer exists.
+
+    Returns:
+        Number of feature files removed
+    """
+    folder = Path(FEATURE_STORE_FOLDER)
+    if not folder.exists():
+        return 0
+
+    removed = 0
+    for path in folder.glob("*.npz"):
+        try:
+            with np.load(path) as data:
+                source = str(data["source"])
+        except (OSError, KeyError, ValueError):
+            source = ""
+        if not os.path.exists(source):
+            path.unlink()
+            removed += 1
+    return removed
@@ -4,6 +4,8 @@ from typing import Tuple
 import numpy as np
 from scipy.signal import get_window
 import librosa
+from config import SAVE_FEATURES
+from feature_store import save_features
 
 def audio_loader(file_path:str) -> Tuple[np.array, float]:
     """ Uses log spectral flux style onset detection with ffts
@@ -112,6 +114,19 @@ def frames_to_sec(frame_peaks: np.array, samplerate: int, hop_size: int) -> np.a
     frame_sec = (frame_peaks * hop_size) / samplerate
     return frame_sec
 
+def flux_to_onsets(
+        flux: np.array,
+        samplerate: int,
+        hop_size: int = 512,
+        threshold_factor: float = 1.25) -> list[float]:
+    """
+    Picks peaks in a flux curve and converts them to onset times
+    split out so stored flux can be re-thresholded without re-analysis
+    """
+    frame_peaks = find_peaks(flux, threshold_factor)
+    onsets = frames_to_sec(frame_peaks, samplerate, hop_size)
+    return list(onsets)
+
 def detect_onsets_inhouse(
         file_path:str,
         frame_size: int = 2048, 
@@ -132,6 +147,6 @@ def detect_onsets_inhouse(
     duration = len(signal) / samplerate
     spectra = window_fft(signal, frame_size, hop_size)
     flux = calculate_flux(spectra)
-    frame_peaks = find_peaks(flux, threshold_factor)
-    onsets = frames_to_sec(frame_peaks, samplerate, hop_size)
-    return duration, list(onsets)
+    if SAVE_FEATURES:
+        save_features(file_path, "inhouse", flux, samplerate, hop_size)
+    return duration, flux_to_onsets(flux, samplerate, hop_size, threshold_factor)
@@ -0,0 +1,124 @@
+"""Library Table Module"""
+
+import random
+import threading
+from typing import Optional
+import numpy as np
+from cache import get_cached_onsets, detector_is_current, add_update_listener
+from config import ONSET_DETECTORS
+
+TABLE_DTYPE = np.dtype(
+    [("duration", "f4"), ("bpm", "f4"), ("beat_count", "i4")]
+    + [(f"onsets_{algorithm}", "i4") for algorithm in ONSET_DETECTORS]
+)
+
+# unknown values: NaN never passes a comparison and -1 marks missing counts
+EMPTY_ROW = (np.nan, np.nan, -1) + (-1,) * len(ONSET_DETECTORS)
+
+
+class LibraryTable:
+    """Columnar copy of the cached metadata, one row per library file (row index = file id)."""
+
+    def __init__(self, files: list[str], cache: dict):
+        self.files = list(files)
+        self.ids = {file_path: file_id for file_id, file_path in enumerate(self.files)}
+        self.cache = cache
+        self.rows = np.empty(len(self.files), dtype=TABLE_DTYPE)
+        self.rows[:] = EMPTY_ROW
+
+        # last query's matches, reused until a row changes
+        self.lock = threading.Lock()
+        self.version = 0
+        self.last_query: Optional[tuple] = None
+        self.last_ids: np.ndarray = np.arange(0)
+
+        for file_path in self.files:
+            self.refresh(file_path)
+        add_update_listener(self.refresh)
+
+    def refresh(self, file_path: str) -> None:
+        """
+        Rebuild one file's row from its cache entry.
+
+        Args:
+            file_path: Path to audio file
+        """
+        file_id = self.ids.get(file_path)
+        if file_id is None:
+            return
+
+        cached = get_cached_onsets(file_path, self.cache)
+        if cached is None:
+            row = EMPTY_ROW
+        else:
+            row = (
+                cached.get("duration", np.nan),
+                cached.get("bpm", np.nan),
+                len(cached["beats"]) if "beats" in cached else -1,
+            ) + tuple(
+                len(cached[f"onsets_{algorithm}"])
+                if f"onsets_{algorithm}" in cached and detector_is_current(cached, algorithm)
+                else -1
+                for algorithm in ONSET_DETECTORS
+            )
+
+        with self.lock:
+            self.rows[file_id] = row
+            self.version += 1
+
+    def query(self, min_bpm: Optional[float] = None, max_bpm: Optional[float] = None,
+              min_duration: Optional[float] = None, max_duration: Optional[float] = None,
+              min_density: Optional[float] = None, algorithm: str = "librosa") -> np.ndarray:
+        """
+        Find files matching every given filter. Files missing a value a
+        filter needs (e.g. no BPM yet) don't match it.
+
+        Args:
+            min_bpm / max_bpm: BPM range
+            min_duration / max_duration: Duration range in seconds
+            min_density: Minimum onsets per second for `algorithm`
+            algorithm: Onset algorithm used for density
+
+        Returns:
+            Array of matching file ids
+        """
+        key = (min_bpm, max_bpm, min_duration, max_duration, min_density, algorithm)
+        with self.lock:
+            if self.last_query == (self.version, key):
+                return self.last_ids
+
+            rows = self.rows
+            mask = np.ones(len(rows), dtype=bool)
+            if min_bpm is not None:
+                mask &= rows["bpm"] >= min_bpm
+            if max_bpm is not None:
+                mask &= rows["bpm"] <= max_bpm
+            if min_duration is not None:
+                mask &= rows["duration"] >= min_duration
+            if max_duration is not None:
+                mask &= rows["duration"] <= max_duration
+            if min_density is not None:
+                onsets = rows[f"onsets_{algorithm}"]
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    density = onsets / rows["duration"]
+                mask &= (onsets >= 0) & (density >= min_density)
+
+            self.last_ids = np.flatnonzero(mask)
+            self.last_query = (self.version, key)
+            return self.last_ids
+
+    def pick(self, rng: Optional[random.Random] = None, **filters) -> Optional[str]:
+        """
+        Pick a random file matching the filters.
+
+        Args:
+            rng: Random generator to use, defaults to the random module
+            filters: Keyword filters accepted by query()
+
+        Returns:
+            File path, or None if nothing matches
+        """
+        ids = self.query(**filters)
+        if len(ids) == 0:
+            return None
+        return self.files[ids[(rng or random).randrange(len(ids))]]
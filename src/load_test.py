@@ -0,0 +1,74 @@
+"""Load test for the excerpt server
+
+Fires concurrent requests at a running server and reports latency percentiles.
+
+Run with: python src/load_test.py --requests 200 --concurrency 16 --path "/excerpt?mode=bar"
+"""
+
+import argparse
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from config import SERVER_HOST, SERVER_PORT
+
+
+def timed_request(url: str) -> tuple[float, bool]:
+    """
+    Fetch a URL and time it.
+
+    Returns:
+        Tuple of (latency in seconds, succeeded)
+    """
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=300) as response:
+            response.read()
+            ok = response.status == 200
+    except (urllib.error.URLError, OSError):
+        ok = False
+    return time.perf_counter() - start, ok
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(1, round(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+def main():
+    """Run the load test and print a summary."""
+    parser = argparse.ArgumentParser(description="Load test the excerpt server")
+    parser.add_argument("--url", default=f"http://{SERVER_HOST}:{SERVER_PORT}")
+    parser.add_argument("--path", default="/excerpt?mode=beat")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--seeded", action="store_true",
+                        help="add seed=i to each request for a repeatable mix of files")
+    args = parser.parse_args()
+
+    separator = "&" if "?" in args.path else "?"
+    urls = [
+        f"{args.url}{args.path}{separator}seed={i}" if args.seeded else f"{args.url}{args.path}"
+        for i in range(args.requests)
+    ]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(timed_request, urls))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for latency, ok in results if ok)
+    errors = sum(1 for _, ok in results if not ok)
+
+    print(f"Requests: {len(results)}  Errors: {errors}  Concurrency: {args.concurrency}")
+    print(f"Throughput: {len(results) / elapsed:.1f} req/s")
+    print(f"p50: {percentile(latencies, 50) * 1000:.1f} ms  "
+          f"p99: {percentile(latencies, 99) * 1000:.1f} ms  "
+          f"max: {(latencies[-1] if latencies else 0) * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    main()
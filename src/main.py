@@ -1,14 +1,29 @@
 """Main loop Module"""
+import os
 import sys
 import random
 
 from scanner import scan_music_library
 from selector import choose_random_excerpt_bars
 from selector import choose_random_excerpt_manual, choose_random_excerpt_beats
+from selector import rederive_onsets
 from player import ExcerptPlayer
-from config import EXCERPT_LENGTH, EXPORTS_FOLDER
-from exporter import export_excerpt
-from cache import load_cache, save_cache
+from audition import AuditionQueue
+from config import MUSIC_FOLDER, EXCERPT_LENGTH, EXPORTS_FOLDER
+from config import EXPORT_FORMAT, EXPORT_BIT_DEPTH, EXPORT_SAMPLE_RATE
+from config import ONSET_DETECTORS, CACHE_AUTO_PRUNE, PROBE_ON_SCAN, SIMILARITY_INDEX
+from probe import probe_library
+from library import LibraryTable
+from similarity import excerpt_vector, find_similar, load_records, prune_windows
+from feature_store import prune_features
+from exporter import ExportQueue, EXPORT_FORMATS
+from cache import load_cache, save_cache, prune_cache, maintain_cache, cache_stats
+from cache import flush_cache, start_autosave, stop_autosave, get_cached_onsets
+
+
+def format_rate(rate):
+    """Percentage for a hit rate, n/a if nothing was looked up yet"""
+    return "n/a" if rate is None else f"{rate:.0%}"
 
 
 class MusicExcerptSampler:
@@ -26,6 +41,15 @@ class MusicExcerptSampler:
         # beat, bar, onset
         self.num_bars: int = 4
         self.algorithm:str = "librosa"
+        self.library: LibraryTable = None
+        # min_bpm, max_bpm, min_duration, min_density filters for picking files
+        self.filters: dict = {}
+
+        self.audition: AuditionQueue = AuditionQueue(lambda: self.pick_excerpt()[:3])
+        self.exporter: ExportQueue = ExportQueue()
+        self.export_format: str = EXPORT_FORMAT
+        self.export_bit_depth: int = EXPORT_BIT_DEPTH
+        self.export_sample_rate = EXPORT_SAMPLE_RATE
 
 
     def initialize(self):
@@ -40,6 +64,18 @@ class MusicExcerptSampler:
         print("Loading cache...")
         self.cache = load_cache()
         print(f"Caches has {len(self.cache)} entries")
+        if CACHE_AUTO_PRUNE and self.files and os.path.isdir(MUSIC_FOLDER):
+            # an empty scan means the library is missing (unmounted drive, wrong MUSIC_FOLDER),
+            # not that every file was deleted; full pruning is left to [C]
+            removed = prune_cache(self.cache, root=MUSIC_FOLDER)
+            if removed:
+                print(f"Pruned {len(removed)} entries for missing files")
+        if PROBE_ON_SCAN:
+            print("Reading file headers...")
+            probed = probe_library(self.files, self.cache)
+            print(f"Probed {probed} new or changed files")
+        self.library = LibraryTable(self.files, self.cache)
+        start_autosave(self.cache)
 
     def toggle_mode(self):
         """Toggles mode between beat locked, onset bar length, and manual onset"""
@@ -70,13 +106,14 @@ class MusicExcerptSampler:
 
 
 
-    def select_random_excerpt(self):
-        """ Pick random file + random excerpt"""
-
-        if self.player.is_playing():
-            self.player.stop()
-
-        random_file = random.choice(self.files)
+    def pick_excerpt(self):
+        """Pick random file + random excerpt for the current mode, without loading it"""
+        if self.filters:
+            random_file = self.library.pick(algorithm=self.algorithm, **self.filters)
+            if random_file is None:
+                raise ValueError("No files match the current filters")
+        else:
+            random_file = random.choice(self.files)
 
         if self.mode == "beat":
             start, end, bpm = choose_random_excerpt_beats(
@@ -92,6 +129,25 @@ class MusicExcerptSampler:
                 random_file, EXCERPT_LENGTH, self.cache, algorithm=self.algorithm)
             mode_info = f"manual onset mode ({EXCERPT_LENGTH}s)"
 
+        return random_file, start, end, mode_info
+
+    def select_random_excerpt(self):
+        """ Pick random file + random excerpt"""
+
+        if self.audition.is_running():
+            self.stop_audition()
+        if self.player.is_playing():
+            self.player.stop()
+
+        try:
+            random_file, start, end, mode_info = self.pick_excerpt()
+        except ValueError as e:
+            print(e)
+            return
+
+        # persist any new analysis right away rather than waiting for quit
+        flush_cache(self.cache)
+
         self.player.load_excerpt(random_file, start, end)
         self.current_file = random_file
 
@@ -100,11 +156,52 @@ class MusicExcerptSampler:
         print(f"{random_file} was selected")
         print(f"Excerpt: {duration:.2f}s ({mode_info})")
 
+    def select_similar_excerpt(self):
+        """Find excerpts similar to the current one and load the closest"""
+        if not self.current_file:
+            print("Nothing loaded")
+            return
+        if len(load_records()) == 0:
+            if SIMILARITY_INDEX:
+                print("No similar excerpts indexed yet (they're added as files are analyzed)")
+            else:
+                print("No similar excerpts indexed (set SIMILARITY_INDEX = True in config.py)")
+            return
+
+        info = self.player.get_info()
+        # indexed windows use the file's detected BPM, so the query should too
+        cached = get_cached_onsets(info["file_path"], self.cache)
+        tempo = cached.get("bpm") if cached is not None else None
+        query = excerpt_vector(info["file_path"], info["start_time"], info["end_time"], tempo)
+        exclude = (info["file_path"], info["start_time"], info["end_time"])
+        results = find_similar(query, exclude=exclude)
+        if not results:
+            print("No similar excerpts found")
+            return
+
+        print("Most similar excerpts:")
+        for rank, result in enumerate(results, start=1):
+            print(f"  {rank}. {result['file_path']} "
+                  f"({result['start_time']:.2f}s - {result['end_time']:.2f}s) "
+                  f"score {result['score']:.3f}")
+
+        if self.audition.is_running():
+            self.stop_audition()
+        if self.player.is_playing():
+            self.player.stop()
+        best = results[0]
+        self.player.load_excerpt(best["file_path"], best["start_time"], best["end_time"])
+        self.current_file = best["file_path"]
+        self.last_mode_info = f"similar excerpt (score {best['score']:.3f})"
+        print(f"{best['file_path']} was selected")
+
     def toggle_playback(self):
         """Play or pause"""
         if not self.current_file:
             print("nothing loaded")
             return
+        if self.audition.is_running():
+            self.stop_audition()
         if self.player.is_playing():
             self.player.stop()
             self.is_playing = False
@@ -112,22 +209,120 @@ class MusicExcerptSampler:
             self.player.play()
             self.is_playing = True
 
+    def toggle_audition(self):
+        """Start/stop gapless audition of a continuous stream of excerpts"""
+        if self.audition.is_running():
+            self.stop_audition()
+            return
+        if self.player.is_playing():
+            self.player.stop()
+        self.is_playing = False
+        self.audition.start(self.player.get_volume())
+        print("→ Gapless audition started")
+
+    def stop_audition(self):
+        """Stop audition mode"""
+        self.audition.stop()
+        print("→ Gapless audition stopped")
+
     def export_current(self):
         """Save excerpt to file"""
         if self.current_file == "":
             print("Nothing loaded")
             return
         try:
-            output_path = export_excerpt(self.player, EXPORTS_FOLDER)
-            print(f"Exported to: {output_path}")
+            future = self.exporter.submit(
+                self.player, EXPORTS_FOLDER, self.export_format,
+                self.export_bit_depth, self.export_sample_rate)
         except Exception as e:
             print(f"Export failed: {e}")
+            return
+        future.add_done_callback(self._report_export)
+        print(f"Export queued ({self.export_format})")
+
+    def _report_export(self, future):
+        """Print result of a background export"""
+        try:
+            print(f"\nExported to: {future.result()}")
+        except Exception as e:
+            print(f"\nExport failed: {e}")
+
+    def set_export_options(self):
+        """Choose format, bit depth and sample rate for exports"""
+        fmt = input(f"Format {EXPORT_FORMATS} [{self.export_format}]: ").lower().strip()
+        if fmt:
+            if fmt not in EXPORT_FORMATS:
+                print("Invalid format")
+                return
+            self.export_format = fmt
+
+        depth = input(f"Bit depth (16/24/32) [{self.export_bit_depth}]: ").strip()
+        if depth:
+            if depth not in ("16", "24", "32"):
+                print("Invalid bit depth")
+                return
+            self.export_bit_depth = int(depth)
+
+        rate = input(f"Sample rate (blank = keep) [{self.export_sample_rate or 'keep'}]: ").strip()
+        if rate:
+            try:
+                self.export_sample_rate = int(rate)
+            except ValueError:
+                print("Invalid sample rate")
+                return
 
     def change_volume(self, adjustment):
         """Increase/decrease volume"""
         current_volume = self.player.get_volume_percent()
         new_volume = max(0.0, min(100.0, (adjustment + current_volume)))
         self.player.set_volume_percent(new_volume)
+        self.audition.set_volume(new_volume / 100.0)
+
+    def retune_onsets(self):
+        """Re-derive onsets for the current algorithm from stored feature curves"""
+        params = ONSET_DETECTORS[self.algorithm]["params"]
+        print(f"Using {self.algorithm} params from config.py: {params}")
+        updated = rederive_onsets(self.cache, self.algorithm)
+        print(f"Re-derived {self.algorithm} onsets for {updated} files")
+
+    def maintain_cache(self):
+        """Prune/compact the cache and show its stats"""
+        summary = maintain_cache(self.cache)
+        print(f"Pruned {summary['pruned']} missing files, "
+              f"removed {summary['compacted']} outdated results, "
+              f"{prune_features()} feature files, "
+              f"{prune_windows()} similarity windows")
+        stats = cache_stats(self.cache)
+        print(f"Entries: {stats['entries']}  Onset lists: {stats['onset_lists']}")
+        print(f"Size: {stats['file_bytes'] / 1024:.1f} KB  "
+              f"Hit rate: {format_rate(stats['session_hit_rate'])} (session), "
+              f"{format_rate(stats['lifetime_hit_rate'])} (all time)")
+
+    def set_filters(self):
+        """Set BPM/duration/onset density filters for picking files"""
+        print("Leave blank for no filter")
+        try:
+            bpm_range = input("BPM range (e.g. 90-110): ").strip()
+            min_duration = input("Minimum duration (s): ").strip()
+            min_density = input(f"Minimum onsets per second ({self.algorithm}): ").strip()
+
+            filters = {}
+            if bpm_range:
+                low, high = bpm_range.split("-")
+                filters["min_bpm"] = float(low)
+                filters["max_bpm"] = float(high)
+            if min_duration:
+                filters["min_duration"] = float(min_duration)
+            if min_density:
+                filters["min_density"] = float(min_density)
+        except ValueError:
+            print("Invalid filter")
+            return
+
+        self.filters = filters
+        if filters:
+            matches = len(self.library.query(algorithm=self.algorithm, **filters))
+            print(f"{matches} of {len(self.files)} files match (only analyzed files have BPM/onsets)")
 
     def show_menu(self):
         """Display current state and options"""
@@ -147,48 +342,85 @@ class MusicExcerptSampler:
                 f"[{duration}s ({self.last_mode_info})]")
         else:
             print(f"Excerpt: {info['start_time']:.2f}s - {info['end_time']:.2f}s [{duration:.2f}s]")
-        print((f"Onset Algorithm: {self.algorithm}\n"))
+        print((f"Onset Algorithm: {self.algorithm}"))
+        if self.filters:
+            print(f"Filters: {self.filters}")
+        print()
 
         print(f"Status: {playing}")
+        if self.audition.is_running():
+            audition_info = self.audition.get_info()
+            if audition_info:
+                print(f"Auditioning: {audition_info['file_path']} "
+                      f"({audition_info['start_time']:.2f}s - {audition_info['end_time']:.2f}s)")
+            else:
+                print("Auditioning: rendering...")
         print(f"Volume: {self.player.get_volume_percent()}")
 
         print("\n[R] Randomize new excerpt")
+        print("[S] Find similar excerpt")
         print("[P] Play/Pause")
+        print("[G] Start/stop gapless audition")
         print("[+] Volume up   [-] Volume down")
         print("[B] Toggle mode")
         print("[A] Toggle onset detection algorithm")
+        print("[F] Set library filters (BPM, duration, onset density)")
         print("[E] Export current excerpt")
+        print("[O] Export options")
+        print("[T] Re-tune onsets from stored features")
+        print("[C] Cache maintenance and stats")
         print("[Q] Quit\n")
 
 
     def run(self):
         """Main loop - handle user input"""
 
-        while True:
-            self.show_menu()
-            choice = input("Enter choice: ").lower().strip()
-
-            if choice == 'r':
-                self.select_random_excerpt()
-            elif choice == 'p':
-                self.toggle_playback()
-            elif choice == '+':
-                self.change_volume(10)
-            elif choice == '-':
-                self.change_volume(-10)
-            elif choice == 'e':
-                self.export_current()
-            elif choice == 'b':
-                self.toggle_mode()
-            elif choice == 'a':
-                self.toggle_algorithm()
-            elif choice == 'q':
-                print("Saving cache...")
-                save_cache(self.cache)
-                print("Bye!")
-                break
-            else:
-                print("Invalid choice!")
+        try:
+            while True:
+                self.show_menu()
+                choice = input("Enter choice: ").lower().strip()
+
+                if choice == 'r':
+                    self.select_random_excerpt()
+                elif choice == 's':
+                    self.select_similar_excerpt()
+                elif choice == 'p':
+                    self.toggle_playback()
+                elif choice == 'g':
+                    self.toggle_audition()
+                elif choice == '+':
+                    self.change_volume(10)
+                elif choice == '-':
+                    self.change_volume(-10)
+                elif choice == 'e':
+                    self.export_current()
+                elif choice == 'o':
+                    self.set_export_options()
+                elif choice == 'b':
+                    self.toggle_mode()
+                elif choice == 'a':
+                    self.toggle_algorithm()
+                elif choice == 'f':
+                    self.set_filters()
+                elif choice == 't':
+                    self.retune_onsets()
+                elif choice == 'c':
+                    self.maintain_cache()
+                elif choice == 'q':
+                    self.audition.stop()
+                    print("Waiting for exports...")
+                    self.exporter.shutdown()
+                    print("Bye!")
+                    break
+                else:
+                    print("Invalid choice!")
+        except KeyboardInterrupt:
+            print("\nInterrupted")
+        finally:
+            # always persist, even on Ctrl-C or an unexpected error
+            stop_autosave()
+            print("Saving cache...")
+            save_cache(self.cache)
 
 def main():
     """Entry point."""
@@ -1,7 +1,12 @@
 """Music Player Module"""
-from typing import Optional
+from math import gcd
+from typing import Optional, Tuple
+import numpy as np
+from scipy.signal import resample_poly
+import soundfile as sf
 from pydub import AudioSegment
 import pygame
+from config import FADE_IN_MS, FADE_OUT_MS
 
 #Uncomment on windows only
 
@@ -10,11 +15,165 @@ import pygame
 # os.environ["PATH"] += os.pathsep + r"C:\ffmpeg\bin"
 
 
+def render_excerpt(file_path: str, start: float, end: float,
+                   frame_rate: int = 44100,
+                   fade_in_ms: int = FADE_IN_MS,
+                   fade_out_ms: int = FADE_OUT_MS) -> np.ndarray:
+    """
+    Decode an excerpt and convert it to 16-bit stereo with fades.
+    Only the excerpt is resampled/converted, never the whole track.
+    
+    Args:
+        file_path: Path to audio file
+        start: Start time in seconds
+        end: End time in seconds
+        frame_rate: Output sample rate
+        fade_in_ms: Fade in length
+        fade_out_ms: Fade out length
+        
+    Returns:
+        int16 samples shaped (frames, 2)
+    """
+    # same millisecond resolution pydub slicing used
+    start_ms = int(start * 1000)
+    end_ms = int(end * 1000)
+
+    samples, source_rate = read_excerpt(file_path, start_ms, end_ms)
+
+    if source_rate != frame_rate:
+        divisor = gcd(frame_rate, source_rate)
+        samples = resample_poly(samples, frame_rate // divisor, source_rate // divisor, axis=0)
+        samples = samples.astype(np.float32, copy=False)
+
+    if samples.shape[1] == 1:
+        samples = np.broadcast_to(samples, (len(samples), 2)).copy()
+    elif samples.shape[1] > 2:
+        samples = np.broadcast_to(samples.mean(axis=1, keepdims=True), (len(samples), 2)).copy()
+
+    # quantize to 16-bit before fading, as set_sample_width(2) did (floor, like audioop)
+    samples *= 32768.0
+    np.floor(samples, out=samples)
+    np.clip(samples, -32768, 32767, out=samples)
+    samples = samples.astype(np.int16)
+
+    samples = apply_fade(samples, frame_rate, fade_in_ms, fade_in=True)
+    return apply_fade(samples, frame_rate, fade_out_ms, fade_in=False)
+
+def ms_to_frame(ms: int, frame_rate: int) -> int:
+    """
+    Frame index for a millisecond position, rounded the way pydub slices.
+    """
+    return int(ms * (frame_rate / 1000.0))
+
+def read_excerpt(file_path: str, start_ms: int, end_ms: int) -> Tuple[np.ndarray, int]:
+    """
+    Read just the excerpt's frames as float32, seeking instead of decoding
+    the whole file when libsndfile can read the format.
+    
+    Returns:
+        Tuple of (samples shaped (frames, channels), sample rate)
+    """
+    try:
+        with sf.SoundFile(file_path) as f:
+            start_frame = ms_to_frame(start_ms, f.samplerate)
+            end_frame = ms_to_frame(end_ms, f.samplerate)
+            f.seek(min(start_frame, f.frames))
+            samples = f.read(max(end_frame - start_frame, 0), dtype="float32", always_2d=True)
+            return samples, f.samplerate
+    except (RuntimeError, OSError):
+        # formats libsndfile can't open (m4a etc.) still go through ffmpeg
+        pass
+
+    audio = AudioSegment.from_file(file_path)
+    raw = audio.get_array_of_samples()
+    scale = float(1 << (8 * raw.itemsize - 1))
+    start_frame = ms_to_frame(start_ms, audio.frame_rate)
+    end_frame = ms_to_frame(end_ms, audio.frame_rate)
+    samples = np.frombuffer(raw, dtype=f"i{raw.itemsize}").reshape(-1, audio.channels)
+    return samples[start_frame:end_frame].astype(np.float32) / scale, audio.frame_rate
+
+def apply_fade(samples: np.ndarray, frame_rate: int, duration_ms: int, fade_in: bool) -> np.ndarray:
+    """
+    Apply pydub's fade curve: linear gain between -120 dB and 0 dB, stepped per
+    sample for fades up to 100 ms and per millisecond above that. Mirrors
+    AudioSegment.fade's float64 gain arithmetic and millisecond slicing, so
+    results match it exactly (including the frame a fade-out can drop).
+    
+    Args:
+        samples: int16 samples shaped (frames, channels)
+        frame_rate: Sample rate
+        duration_ms: Fade length
+        fade_in: True to fade in at the start, False to fade out at the end
+        
+    Returns:
+        Faded int16 samples
+    """
+    if duration_ms <= 0 or len(samples) == 0:
+        return samples
+    length_ms = round(1000 * (len(samples) / frame_rate))
+    rate = frame_rate / 1000.0
+
+    silent = 10 ** (-120 / 20)
+    if fade_in:
+        start_ms, from_power, to_power = 0, silent, 1.0
+    else:
+        start_ms, from_power, to_power = length_ms - duration_ms, 1.0, silent
+    end_ms = start_ms + duration_ms
+    gain_delta = to_power - from_power
+
+    parts = [scale(slice_ms(samples, frame_rate, 0, start_ms), from_power)]
+    if duration_ms > 100:
+        step = gain_delta / duration_ms
+        for i in range(duration_ms):
+            chunk = slice_ms(samples, frame_rate, start_ms + i, start_ms + i + 1)
+            parts.append(scale(chunk, from_power + step * i))
+    else:
+        start_frame = start_ms * rate
+        fade_frames = end_ms * rate - start_frame
+        step = gain_delta / fade_frames
+        index = (start_frame + np.arange(int(fade_frames))).astype(int)
+        # frames past the end come back empty from get_frame
+        index = index[index < len(samples)]
+        parts.append(scale(samples[index], from_power + step * np.arange(len(index))[:, np.newaxis]))
+    parts.append(scale(slice_ms(samples, frame_rate, end_ms, length_ms), to_power))
+    return np.concatenate(parts)
+
+def scale(samples: np.ndarray, gain) -> np.ndarray:
+    """
+    int16 samples times a gain (scalar or per-frame column) the way audioop.mul does it.
+    """
+    if np.isscalar(gain) and gain == 1.0:
+        return samples
+    return np.floor(samples * gain).astype(np.int16)
+
+def slice_ms(samples: np.ndarray, frame_rate: int, start_ms: int, end_ms: int) -> np.ndarray:
+    """
+    AudioSegment[start_ms:end_ms] on raw frames, including pydub's
+    rounding and the silence it pads a short slice with.
+    """
+    length_ms = round(1000 * (len(samples) / frame_rate))
+    start = ms_to_frame(min(start_ms, length_ms), frame_rate)
+    end = ms_to_frame(min(end_ms, length_ms), frame_rate)
+    chunk = samples[start:end]
+    missing = (end - start) - len(chunk)
+    if missing > 0 and len(chunk):
+        chunk = np.concatenate([chunk, np.zeros((missing, samples.shape[1]), dtype=samples.dtype)])
+    return chunk
+
+def samples_to_segment(samples: np.ndarray, frame_rate: int = 44100) -> AudioSegment:
+    """
+    Wrap int16 stereo samples in an AudioSegment (no conversion).
+    """
+    return AudioSegment(data=samples.tobytes(), sample_width=2,
+                        frame_rate=frame_rate, channels=samples.shape[1])
+
+
 class ExcerptPlayer:
     """Handles audio loading, slicing, and playback."""
 
     def __init__(self):
         self.current_audio: Optional[AudioSegment] = None
+        self.current_samples: Optional[np.ndarray] = None
         self.file_path: str = ""
         self.start_time: float = 0.0
         self.end_time: float = 0.0
@@ -33,23 +192,23 @@ class ExcerptPlayer:
             start: Start time in seconds
             end: End time in seconds
         """
-        audio = AudioSegment.from_file(file_path)
-
-        audio = audio.set_sample_width(2)
-        audio = audio.set_frame_rate(44100)
-        audio = audio.set_channels(2)
-
-        start_ms = int(start * 1000)
-        end_ms = int(end * 1000)
-
-        excerpt = audio[start_ms:end_ms]
-        excerpt = excerpt.fade_in(5).fade_out(10)
-
-        self.current_audio = excerpt
+        self.current_samples = render_excerpt(file_path, start, end)
+        self.current_audio = samples_to_segment(self.current_samples, 44100)
         self.file_path = file_path
         self.start_time = start
         self.end_time = end
 
+    def get_samples(self) -> Tuple[np.ndarray, int]:
+        """
+        Get the loaded excerpt as a float32 sample buffer.
+        
+        Returns:
+            Tuple of (samples shaped (frames, channels), sample rate)
+        """
+        if self.current_samples is None:
+            raise ValueError("No audio loaded")
+        return self.current_samples.astype(np.float32) / 32768.0, 44100
+
     def play(self) -> None:
         """
         Play the loaded excerpt (non-blocking).
@@ -0,0 +1,97 @@
+"""Audio Metadata Probe Module"""
+
+import json
+import shutil
+import subprocess
+from typing import Optional
+import audioread
+import soundfile as sf
+from cache import get_cached_onsets, update_metadata
+
+
+def probe_audio(file_path: str) -> Optional[dict]:
+    """
+    Read duration, sample rate and channel count from the file's headers
+    without decoding the audio.
+    
+    Args:
+        file_path: Path to audio file
+        
+    Returns:
+        Dict with duration, samplerate, channels or None if unreadable
+    """
+    try:
+        info = sf.info(file_path)
+        return {
+            "duration": info.frames / info.samplerate,
+            "samplerate": info.samplerate,
+            "channels": info.channels,
+        }
+    except (RuntimeError, OSError):
+        # libsndfile can't read it (m4a, some mp3s), try ffprobe next
+        pass
+
+    metadata = probe_ffprobe(file_path)
+    if metadata is not None:
+        return metadata
+
+    try:
+        with audioread.audio_open(file_path) as f:
+            return {"duration": f.duration, "samplerate": f.samplerate, "channels": f.channels}
+    except (audioread.DecodeError, OSError):
+        return None
+
+def probe_ffprobe(file_path: str) -> Optional[dict]:
+    """
+    Probe headers with ffprobe if it is installed.
+    
+    Args:
+        file_path: Path to audio file
+        
+    Returns:
+        Dict with duration, samplerate, channels or None
+    """
+    ffprobe = shutil.which("ffprobe")
+    if ffprobe is None:
+        return None
+
+    command = [
+        ffprobe, "-v", "error", "-select_streams", "a:0",
+        "-show_entries", "stream=sample_rate,channels:format=duration",
+        "-of", "json", file_path,
+    ]
+    try:
+        result = subprocess.run(command, capture_output=True, check=True, timeout=10)
+        data = json.loads(result.stdout)
+        stream = data["streams"][0]
+        return {
+            "duration": float(data["format"]["duration"]),
+            "samplerate": int(stream["sample_rate"]),
+            "channels": int(stream["channels"]),
+        }
+    except (subprocess.SubprocessError, OSError, ValueError, KeyError, IndexError):
+        return None
+
+def probe_library(files: list[str], cache: dict) -> int:
+    """
+    Store header metadata in the cache for every file that doesn't have it yet.
+    
+    Args:
+        files: Audio file paths from the scanner
+        cache: Cache dictionary to update
+        
+    Returns:
+        Number of files probed
+    """
+    probed = 0
+    for file_path in files:
+        cached = get_cached_onsets(file_path, cache)
+        if cached is not None and "samplerate" in cached:
+            continue
+
+        metadata = probe_audio(file_path)
+        if metadata is None:
+            continue
+        update_metadata(file_path, cache, **metadata)
+        probed += 1
+    return probed
@@ -2,13 +2,19 @@
 from typing import Tuple, Optional
 import random
 import librosa
-from cache import get_cached_onsets, update_cache
-from fft_onset import detect_onsets_inhouse
+from cache import get_cached_onsets, get_cached_onset_list, update_cache, update_onsets
+from cache import update_metadata, count_lookup, cached_paths
+from probe import probe_audio
+from fft_onset import detect_onsets_inhouse, flux_to_onsets
+from feature_store import save_features, load_features
+from config import SAVE_FEATURES, ONSET_DETECTORS, SIMILARITY_INDEX
+from similarity import index_excerpt_windows
 
 
 def get_audio_info(file_path: str, 
                    cache: dict, 
-                   algorithm: str = "librosa") -> Tuple[float, list[float], float]:
+                   algorithm: str = "librosa",
+                   count: bool = True) -> Tuple[float, list[float], float]:
     """
     Get duration and onset times for an audio file.
     Uses cache if available, otherwise analyzes file.
@@ -16,54 +22,89 @@ def get_audio_info(file_path: str,
     Args:
         file_path: Path to audio file
         cache: Onset cache dictionary
+        count: Count the cache lookup in the hit rate
         
     Returns:
         Tuple of (duration, onsets_list)
     """
 
-    cached = get_cached_onsets(file_path, cache)
+    cached = get_cached_onset_list(file_path, cache, algorithm, count)
 
     if cached is not None:
-        onset_key = f"onsets_{algorithm}"
-        if onset_key in cached:
-            return cached["duration"], cached[onset_key], cached["bpm"]
-    beats, bpm = detect_beats(file_path)
+        return cached["duration"], cached[f"onsets_{algorithm}"], cached["bpm"]
+    # the onset lookup above is this request's counted one
+    beats, bpm = get_beats_info(file_path, cache, count=False)
 
+    params = ONSET_DETECTORS[algorithm]["params"]
     if algorithm == "librosa":
-        duration, onsets = detect_onsets_librosa(file_path)
+        duration, onsets = detect_onsets_librosa(file_path, **params)
 
     else:
-        duration, onsets = detect_onsets_inhouse(file_path)
+        duration, onsets = detect_onsets_inhouse(file_path, **params)
 
     update_cache(file_path, duration, bpm, beats, cache, onsets, algorithm)
     return duration, onsets, bpm
 
 
-def get_beats_info(file_path: str, cache: dict) -> Tuple[list[float], float]:
+def get_beats_info(file_path: str, cache: dict, count: bool = True) -> Tuple[list[float], float]:
     """
     Get beat positions and BPM from cache or detection.
     
     Args:
         file_path: Path to audio file
         cache: Cache dictionary
+        count: Count the cache lookup in the hit rate
         
     Returns:
         Tuple of (beat_times, bpm)
     """
     cached = get_cached_onsets(file_path, cache)
-    if cached is not None and "beats" in cached:
+    hit = cached is not None and "beats" in cached
+    if count:
+        count_lookup(hit)
+    if hit:
         return cached["beats"], cached["bpm"]
 
     beats, bpm = detect_beats(file_path)
+    if beats:
+        update_metadata(file_path, cache, beats=beats, bpm=bpm)
     return beats, bpm
 
 
-def detect_onsets_librosa(file_path: str) -> Tuple[float, list[float]]:
+def get_duration(file_path: str, cache: dict) -> float:
+    """
+    Get duration from the cache or the file's headers (no decoding).
+    
+    Args:
+        file_path: Path to audio file
+        cache: Cache dictionary
+        
+    Returns:
+        Duration in seconds
+    """
+    cached = get_cached_onsets(file_path, cache)
+    if cached is not None and "duration" in cached:
+        return cached["duration"]
+
+    metadata = probe_audio(file_path)
+    if metadata is not None:
+        update_metadata(file_path, cache, **metadata)
+        return metadata["duration"]
+
+    # unreadable headers, fall back to a full analysis (counted by the beats lookup)
+    duration, _, _ = get_audio_info(file_path, cache, count=False)
+    return duration
+
+
+def detect_onsets_librosa(file_path: str, hop_length: int = 512,
+                          backtrack: bool = True) -> Tuple[float, list[float]]:
     """
     Analyze audio file for onset times using librosa.
     
     Args:
         file_path: Path to audio file
+        hop_length: Hop size in samples for the onset envelope
+        backtrack: Backtrack onsets to the preceding energy minimum
         
     Returns:
         Tuple of (duration, list of onset times in seconds)
@@ -72,15 +113,57 @@ def detect_onsets_librosa(file_path: str) -> Tuple[float, list[float]]:
     y, sr = librosa.load(file_path, sr=None, mono=True)
     duration = librosa.get_duration(y=y, sr=sr)
 
+    onset_env = librosa.onset.onset_strength(y=y, sr=sr, hop_length=hop_length)
+    if SAVE_FEATURES:
+        save_features(file_path, "librosa", onset_env, sr, hop_length)
+
     onsets = librosa.onset.onset_detect(
-        y=y, sr=sr, units="time", backtrack=True
+        onset_envelope=onset_env, sr=sr, hop_length=hop_length, units="time", backtrack=backtrack
     )
 
     return duration, list(onsets)
 
 
+def rederive_onsets(cache: dict, algorithm: str = "inhouse") -> int:
+    """
+    Re-derive cached onsets from stored feature curves (no decoding),
+    using the detector params in config. Params only live in config, so
+    results stay current across sessions instead of being re-analyzed.
+    
+    Args:
+        cache: Onset cache dictionary
+        algorithm: Which onset list to rebuild
+        
+    Returns:
+        Number of cache entries updated
+    """
+    params = ONSET_DETECTORS[algorithm]["params"]
+    hop = params["hop_length"] if algorithm == "librosa" else params["hop_size"]
+
+    updated = 0
+    for file_path in cached_paths(cache):
+        features = load_features(file_path, algorithm)
+        # curves are only valid for the hop they were computed with
+        if features is None or features["hop_size"] != hop:
+            continue
+
+        if algorithm == "librosa":
+            onsets = list(librosa.onset.onset_detect(
+                onset_envelope=features["curve"], sr=features["samplerate"],
+                hop_length=features["hop_size"], units="time", backtrack=params["backtrack"]
+            ))
+        else:
+            onsets = flux_to_onsets(features["curve"], features["samplerate"],
+                                    features["hop_size"], params["threshold_factor"])
+
+        if update_onsets(file_path, cache, onsets, algorithm):
+            updated += 1
+    return updated
+
+
 def choose_random_excerpt_manual(
-        file_path: str, excerpt_length: float, cache: dict, algorithm: str = "librosa") -> Tuple[float, float]:
+        file_path: str, excerpt_length: float, cache: dict, algorithm: str = "librosa",
+        rng: Optional[random.Random] = None, count: bool = True) -> Tuple[float, float]:
     """
     Choose a random excerpt starting at an onset (if available).
     
@@ -88,34 +171,38 @@ def choose_random_excerpt_manual(
         file_path: Path to audio file
         excerpt_length: Desired excerpt length in seconds
         cache: Onset cache dictionary
+        rng: Random generator to use (e.g. seeded), defaults to the random module
+        count: Count the cache lookup in the hit rate
         
     Returns:
         Tuple of (start_time, end_time) in seconds
     """
 
-    duration_onsets = get_audio_info(file_path, cache, algorithm)
+    duration_onsets = get_audio_info(file_path, cache, algorithm, count)
     duration, onsets, _ = duration_onsets
-    random_excerpt = choose_excerpt_from_onsets(onsets, excerpt_length,duration)
+    random_excerpt = choose_excerpt_from_onsets(onsets, excerpt_length,duration, rng)
     if random_excerpt is None:
-        return fallback_random_excerpt(duration, excerpt_length)
+        return fallback_random_excerpt(duration, excerpt_length, rng)
     return random_excerpt
 
 def choose_random_excerpt_bars(
-        file_path: str, cache: dict, num_bars: int = 4, algorithm: str = "librosa") -> Tuple[float, float, float]:
+        file_path: str, cache: dict, num_bars: int = 4, algorithm: str = "librosa",
+        rng: Optional[random.Random] = None, count: bool = True) -> Tuple[float, float, float]:
     """Choose excerpt based on BPM (N bars long)."""
     # Get BPM, calculate length, choose onset
-    duration, onsets, bpm = get_audio_info(file_path, cache, algorithm)
+    duration, onsets, bpm = get_audio_info(file_path, cache, algorithm, count)
     excerpt_length = calculate_excerpt_length_from_bars(bpm, num_bars)
-    random_excerpt = choose_excerpt_from_onsets(onsets, excerpt_length, duration)
+    random_excerpt = choose_excerpt_from_onsets(onsets, excerpt_length, duration, rng)
 
     if random_excerpt is None:
-        start, end =  fallback_random_excerpt(duration, excerpt_length)
+        start, end =  fallback_random_excerpt(duration, excerpt_length, rng)
         return start, end, bpm
     start, end = random_excerpt
     return start, end, bpm
 
 def choose_random_excerpt_beats(
-        file_path: str, cache: dict, num_bars: int = 2) -> Tuple[float, float, float]:
+        file_path: str, cache: dict, num_bars: int = 2,
+        rng: Optional[random.Random] = None, count: bool = True) -> Tuple[float, float, float]:
     """
     Choose excerpt aligned to beats (N beats long).
     
@@ -123,30 +210,32 @@ def choose_random_excerpt_beats(
         file_path: Path to audio file
         cache: Cache
         num_beats: Number of beats for excerpt
+        rng: Random generator to use, defaults to the random module
+        count: Count the cache lookup in the hit rate
         
     Returns:
         (start_time, end_time, bpm)
     """
-    duration, _, _ = get_audio_info(file_path, cache)
-    beats, bpm = get_beats_info(file_path, cache)
+    duration = get_duration(file_path, cache)
+    beats, bpm = get_beats_info(file_path, cache, count)
     excerpt_length = calculate_excerpt_length_from_bars(bpm, num_bars)
 
     valid_beats = [beat for beat in beats if beat <= (duration - excerpt_length)]
 
     if not valid_beats:
         print("list is empty")
-        start, end = fallback_random_excerpt(duration, excerpt_length)
+        start, end = fallback_random_excerpt(duration, excerpt_length, rng)
         return start, end, bpm
 
-    chosen = random.choice(valid_beats)
+    chosen = (rng or random).choice(valid_beats)
 
     end_time = chosen + excerpt_length
 
     return chosen, end_time, bpm
 
 def choose_excerpt_from_onsets(
-        onsets: list[float], excerpt_length: float, duration: float) -> Optional[
-            Tuple[float, float]]:
+        onsets: list[float], excerpt_length: float, duration: float,
+        rng: Optional[random.Random] = None) -> Optional[Tuple[float, float]]:
     """
     Select a random onset as start point for excerpt.
     
@@ -154,6 +243,7 @@ def choose_excerpt_from_onsets(
         onsets: List of onset times
         excerpt_length: Desired length
         duration: Total audio duration
+        rng: Random generator to use, defaults to the random module
         
     Returns:
         (start, end) times or None if no valid onsets
@@ -162,23 +252,25 @@ def choose_excerpt_from_onsets(
     if not valid_onsets:
         print("list is empty")
         return None
-    chosen = random.choice(valid_onsets)
+    chosen = (rng or random).choice(valid_onsets)
     end = chosen + excerpt_length
     return (chosen, end)
 
-def fallback_random_excerpt(duration: float, excerpt_length: float) -> Tuple[float, float]:
+def fallback_random_excerpt(duration: float, excerpt_length: float,
+                            rng: Optional[random.Random] = None) -> Tuple[float, float]:
     """
     Choose random excerpt when no onsets available (ambient/pads).
     
     Args:
         duration: Audio duration
         excerpt_length: Desired length
+        rng: Random generator to use, defaults to the random module
         
     Returns:
         (start, end) times
     """
     max_start = max(0, duration - excerpt_length)
-    start = random.uniform(0, max_start)
+    start = (rng or random).uniform(0, max_start)
     end = start + excerpt_length
     return start, end
 
@@ -223,12 +315,15 @@ def detect_beats(file_path: str) -> Tuple[list[float], float]:
 
         bpm = float(tempo[0]) if len(tempo) > 0 else 120.0
 
-        return list(beat_times), bpm
-
     except Exception as e:
         print(f"Beat detection failed: {e}")
         return [], 120.0
 
+    # every mode runs beat detection first, so this indexes each file once
+    if SIMILARITY_INDEX:
+        index_excerpt_windows(file_path, y, sr, bpm)
+    return list(beat_times), bpm
+
 def calculate_excerpt_length_from_bars(bpm: float, num_bars: int = 4) -> float:
     """
     ASSUMES 4/4 TIME SIG! WONT WORK WITH OTHERS"""
@@ -0,0 +1,303 @@
+"""Local Excerpt Server Module
+
+Serves random excerpts over HTTP to other local tools:
+
+    GET /excerpt?mode=beat&bars=4&algorithm=librosa&seed=7   -> JSON excerpt info
+    GET /excerpt.wav?(same params)                            -> WAV bytes of the excerpt
+    GET /audio?file=...&start=...&end=...                     -> WAV bytes for a given excerpt
+    GET /stats                                                -> cache stats
+
+Run with: python src/server.py [--host HOST] [--port PORT] [--workers N]
+
+Don't run the server and the menu (main.py) at the same time: each saves its
+whole cache to CACHE_FILE, so whichever saves last drops the other's new analyses.
+"""
+
+import argparse
+import io
+import json
+import random
+import signal
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+import soundfile as sf
+
+from config import EXCERPT_LENGTH, ONSET_DETECTORS, SERVER_HOST, SERVER_PORT, SERVER_WORKERS
+from scanner import scan_music_library
+from cache import load_cache, save_cache, start_autosave, stop_autosave, cache_stats
+from cache import get_cached_onsets, update_cache, update_metadata
+from cache import count_lookup, detector_is_current
+from selector import choose_random_excerpt_beats, choose_random_excerpt_bars
+from selector import choose_random_excerpt_manual, detect_beats, detect_onsets_librosa
+from fft_onset import detect_onsets_inhouse
+from probe import probe_audio
+from player import render_excerpt
+
+MODES = ("beat", "bar", "onset")
+
+
+def analyze_file(file_path: str, algorithm: Optional[str]) -> dict:
+    """
+    Worker process: beats (and onsets if an algorithm is given) for one file.
+
+    Args:
+        file_path: Path to audio file
+        algorithm: Onset algorithm, or None for beats/duration only
+
+    Returns:
+        Dict of fields to store in the cache
+    """
+    beats, bpm = detect_beats(file_path)
+    result = {"beats": beats, "bpm": bpm}
+
+    if algorithm is None:
+        metadata = probe_audio(file_path) or {}
+        result.update(metadata)
+        return result
+
+    params = ONSET_DETECTORS[algorithm]["params"]
+    if algorithm == "librosa":
+        duration, onsets = detect_onsets_librosa(file_path, **params)
+    else:
+        duration, onsets = detect_onsets_inhouse(file_path, **params)
+    result.update({"duration": duration, "onsets": onsets})
+    return result
+
+def ignore_interrupts() -> None:
+    """
+    Worker process initializer: Ctrl-C reaches the whole process group,
+    leave it to the parent to shut the pool down cleanly.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def render_wav(file_path: str, start: float, end: float) -> bytes:
+    """
+    Worker process: decode an excerpt and encode it as 16-bit WAV.
+
+    Returns:
+        WAV file bytes
+    """
+    buffer = io.BytesIO()
+    sf.write(buffer, render_excerpt(file_path, start, end), 44100, subtype="PCM_16", format="WAV")
+    return buffer.getvalue()
+
+
+class ExcerptService:
+    """Excerpt selection on top of the shared cache, with analysis on a process pool."""
+
+    def __init__(self, files: list[str], cache: dict, workers: int = SERVER_WORKERS):
+        # sorted so a seed picks the same file every time
+        self.files = sorted(files)
+        self.library = set(self.files)
+        self.cache = cache
+        self.pool = ProcessPoolExecutor(max_workers=workers, initializer=ignore_interrupts)
+        self.inflight: dict = {}
+        self.inflight_lock = threading.Lock()
+
+    def ensure_analyzed(self, file_path: str, mode: str, algorithm: str) -> None:
+        """
+        Make sure the cache has what `mode` needs for this file. Concurrent
+        requests for the same uncached file share one analysis.
+        """
+        key = (file_path, None if mode == "beat" else algorithm)
+        # counted here once per request, so selection below passes count=False
+        hit = self._is_cached(key)
+        count_lookup(hit)
+        if hit:
+            return
+
+        with self.inflight_lock:
+            future = self.inflight.get(key)
+            if future is None:
+                # another request's analysis may have been stored since the check above
+                if self._is_cached(key):
+                    return
+                future = self.pool.submit(analyze_file, *key)
+                self.inflight[key] = future
+
+        try:
+            result = future.result()
+        except Exception:
+            # let the next request retry instead of replaying the failure
+            with self.inflight_lock:
+                if self.inflight.get(key) is future:
+                    del self.inflight[key]
+            raise
+        self._store(key, future, result)
+
+    def _is_cached(self, key: tuple) -> bool:
+        """Check if the cache already holds what an analysis key would produce."""
+        file_path, algorithm = key
+        cached = get_cached_onsets(file_path, self.cache)
+        if cached is None:
+            return False
+        if algorithm is None:
+            return "beats" in cached and "duration" in cached
+        return f"onsets_{algorithm}" in cached and detector_is_current(cached, algorithm)
+
+    def _store(self, key: tuple, future: Future, result: dict) -> None:
+        """Write an analysis result to the cache (once per analysis)."""
+        with self.inflight_lock:
+            if self.inflight.get(key) is not future:
+                # another waiter already stored it
+                return
+            file_path, algorithm = key
+            if algorithm is None:
+                update_metadata(file_path, self.cache, **result)
+            else:
+                update_cache(file_path, result["duration"], result["bpm"], result["beats"],
+                             self.cache, result["onsets"], algorithm)
+            del self.inflight[key]
+
+    def select(self, mode: str = "beat", num_bars: int = 4,
+               algorithm: str = "librosa", seed: Optional[int] = None) -> dict:
+        """
+        Pick a random excerpt.
+
+        Args:
+            mode: beat, bar or onset
+            num_bars: Bars per excerpt for beat/bar modes
+            algorithm: Onset algorithm for bar/onset modes
+            seed: Seed for a reproducible pick
+
+        Returns:
+            Dict with file_path, start_time, end_time, bpm, mode
+        """
+        if not self.files:
+            raise ValueError("No audio files in library")
+        if mode not in MODES:
+            raise ValueError(f"Unknown mode: {mode}")
+        if algorithm not in ONSET_DETECTORS:
+            raise ValueError(f"Unknown algorithm: {algorithm}")
+
+        rng = random.Random(seed)
+        file_path = rng.choice(self.files)
+        self.ensure_analyzed(file_path, mode, algorithm)
+
+        bpm = None
+        if mode == "beat":
+            start, end, bpm = choose_random_excerpt_beats(
+                file_path, self.cache, num_bars=num_bars, rng=rng, count=False)
+        elif mode == "bar":
+            start, end, bpm = choose_random_excerpt_bars(
+                file_path, self.cache, num_bars=num_bars, algorithm=algorithm, rng=rng, count=False)
+        else:
+            start, end = choose_random_excerpt_manual(
+                file_path, EXCERPT_LENGTH, self.cache, algorithm=algorithm, rng=rng, count=False)
+
+        return {"file_path": file_path, "start_time": start, "end_time": end,
+                "bpm": bpm, "mode": mode}
+
+    def render(self, file_path: str, start: float, end: float) -> bytes:
+        """
+        Decode an excerpt to WAV bytes on the process pool.
+        """
+        if file_path not in self.library:
+            raise ValueError("File is not in the library")
+        if end <= start:
+            raise ValueError("end must be after start")
+        return self.pool.submit(render_wav, file_path, start, end).result()
+
+    def shutdown(self) -> None:
+        """
+        Stop the worker pool.
+        """
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+
+class ExcerptRequestHandler(BaseHTTPRequestHandler):
+    """HTTP front end for an ExcerptService."""
+
+    service: ExcerptService = None
+
+    def do_GET(self):
+        """Route GET requests."""
+        url = urlparse(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            if url.path == "/excerpt":
+                self._send_json(self._select(query))
+            elif url.path == "/excerpt.wav":
+                excerpt = self._select(query)
+                audio = self.service.render(
+                    excerpt["file_path"], excerpt["start_time"], excerpt["end_time"])
+                self._send_wav(audio, excerpt)
+            elif url.path == "/audio":
+                excerpt = {"file_path": query["file"],
+                           "start_time": float(query["start"]),
+                           "end_time": float(query["end"])}
+                audio = self.service.render(
+                    excerpt["file_path"], excerpt["start_time"], excerpt["end_time"])
+                self._send_wav(audio, excerpt)
+            elif url.path == "/stats":
+                self._send_json(cache_stats(self.service.cache))
+            else:
+                self._send_json({"error": "not found"}, status=404)
+        except (KeyError, ValueError) as e:
+            self._send_json({"error": str(e)}, status=400)
+        except Exception as e:
+            self._send_json({"error": str(e)}, status=500)
+
+    def _select(self, query: dict) -> dict:
+        seed = query.get("seed")
+        return self.service.select(
+            mode=query.get("mode", "beat"),
+            num_bars=int(query.get("bars", 4)),
+            algorithm=query.get("algorithm", "librosa"),
+            seed=int(seed) if seed is not None else None,
+        )
+
+    def _send_json(self, data: dict, status: int = 200) -> None:
+        body = json.dumps(data).encode("UTF8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_wav(self, audio: bytes, excerpt: dict) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "audio/wav")
+        self.send_header("Content-Length", str(len(audio)))
+        self.send_header("X-Excerpt-File", excerpt["file_path"].encode("UTF8").decode("latin-1"))
+        self.send_header("X-Excerpt-Start", f"{excerpt['start_time']:.3f}")
+        self.send_header("X-Excerpt-End", f"{excerpt['end_time']:.3f}")
+        self.end_headers()
+        self.wfile.write(audio)
+
+    def log_message(self, format, *args):
+        # keep the console quiet under load
+        pass
+
+
+def main():
+    """Entry point for server mode."""
+    parser = argparse.ArgumentParser(description="Serve random excerpts over HTTP")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS)
+    args = parser.parse_args()
+
+    files = scan_music_library()
+    cache = load_cache()
+    start_autosave(cache)
+
+    service = ExcerptService(files, cache, workers=args.workers)
+    ExcerptRequestHandler.service = service
+    server = ThreadingHTTPServer((args.host, args.port), ExcerptRequestHandler)
+    print(f"Serving {len(files)} files on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down...")
+    finally:
+        server.server_close()
+        stop_autosave()
+        save_cache(cache)
+        service.shutdown()
+
+if __name__ == "__main__":
+    main()
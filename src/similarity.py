@@ -0,0 +1,422 @@
+"""Similar Excerpt Module
+
+Each analyzed file is cut into EXCERPT_LENGTH windows every SIMILARITY_WINDOW_HOP
+seconds, and each window gets a small summary vector (mean chroma + MFCC + the file's tempo).
+Vectors are appended to one contiguous record file that is memory-mapped for
+brute-force cosine search, with an optional k-means index for big libraries.
+
+Build the cluster index with: python src/similarity.py --build-index
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+import numpy as np
+import librosa
+from config import EXCERPT_LENGTH, SIMILARITY_FOLDER, SIMILARITY_WINDOW_HOP, SIMILARITY_TOP_K
+
+N_CHROMA = 12
+N_MFCC = 13
+VECTOR_SIZE = N_CHROMA + N_MFCC + 1
+N_FFT = 2048
+HOP_LENGTH = 512
+
+RECORD_DTYPE = np.dtype([
+    ("file_id", "u8"),
+    ("last_modified", "f8"),
+    ("start", "f4"),
+    ("end", "f4"),
+    ("vector", "f2", (VECTOR_SIZE,)),
+])
+
+VECTORS_FILE = Path(SIMILARITY_FOLDER) / "windows.bin"
+PATHS_FILE = Path(SIMILARITY_FOLDER) / "paths.jsonl"
+CLUSTERS_FILE = Path(SIMILARITY_FOLDER) / "clusters.npz"
+LOCK_FILE = Path(SIMILARITY_FOLDER) / "index.lock"
+
+# a lock file older than this was left by a crashed process
+LOCK_STALE_SECONDS = 60
+
+# rows scored per step, keeps memory flat when the matrix is memory-mapped
+CHUNK_ROWS = 65536
+
+
+def file_id(file_path: str) -> int:
+    """
+    Stable 64-bit id for a file path.
+    """
+    return int(hashlib.sha1(file_path.encode("UTF8")).hexdigest()[:16], 16)
+
+def window_vectors(y: np.ndarray, sr: int, starts: np.ndarray, ends: np.ndarray,
+                   tempo: Optional[float] = None) -> np.ndarray:
+    """
+    Summary vector for each [start, end) window (seconds) of a mono signal.
+
+    Args:
+        y: Mono signal
+        sr: Sample rate
+        starts: Window start times
+        ends: Window end times
+        tempo: BPM of the signal if already known, estimated otherwise
+
+    Returns:
+        Unit-length float32 vectors shaped (windows, VECTOR_SIZE)
+    """
+    # one power spectrogram shared by chroma and MFCC (tuning estimation is most of chroma's cost)
+    power = np.abs(librosa.stft(y, n_fft=N_FFT, hop_length=HOP_LENGTH)) ** 2
+    chroma = librosa.feature.chroma_stft(S=power, sr=sr, tuning=0.0)
+    mel = librosa.power_to_db(librosa.feature.melspectrogram(S=power, sr=sr))
+    # first coefficient is overall loudness, which shouldn't count toward similarity
+    mfcc = librosa.feature.mfcc(S=mel, n_mfcc=N_MFCC + 1)[1:]
+    if tempo is None:
+        tempo = float(librosa.feature.tempo(y=y, sr=sr, hop_length=HOP_LENGTH)[0])
+
+    frames = min(chroma.shape[1], mfcc.shape[1])
+    if frames == 0:
+        return np.zeros((len(starts), VECTOR_SIZE), dtype=np.float32)
+    features = np.vstack([chroma[:, :frames], mfcc[:, :frames]])
+
+    # window means from a running sum, one pass over the frames
+    totals = np.concatenate([np.zeros((features.shape[0], 1)), np.cumsum(features, axis=1)], axis=1)
+    start_frames = np.clip(librosa.time_to_frames(starts, sr=sr, hop_length=HOP_LENGTH), 0, frames - 1)
+    end_frames = np.clip(librosa.time_to_frames(ends, sr=sr, hop_length=HOP_LENGTH),
+                         start_frames + 1, frames)
+    means = (totals[:, end_frames] - totals[:, start_frames]) / (end_frames - start_frames)
+    means = means.T
+
+    # give chroma, timbre and tempo similar weight despite their different scales
+    chroma_part = _unit(means[:, :N_CHROMA])
+    mfcc_part = _unit(means[:, N_CHROMA:])
+    tempo_part = np.full((len(means), 1), tempo / 200.0)
+    return _unit(np.hstack([chroma_part, mfcc_part, tempo_part])).astype(np.float32)
+
+def _unit(vectors: np.ndarray) -> np.ndarray:
+    """Scale rows to unit length."""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-9)
+
+def index_excerpt_windows(file_path: str, y: np.ndarray, sr: int,
+                          tempo: Optional[float] = None) -> int:
+    """
+    Add vectors for every excerpt window of an already decoded file.
+    Called from beat detection so no extra decode is needed.
+
+    Args:
+        file_path: Path to audio file
+        y: Mono signal
+        sr: Sample rate
+        tempo: Detected BPM of the file
+
+    Returns:
+        Number of windows added (0 if already indexed)
+    """
+    try:
+        last_modified = os.path.getmtime(file_path)
+        fid = file_id(file_path)
+        if is_indexed(fid, last_modified):
+            return 0
+
+        duration = len(y) / sr
+        starts = np.arange(0.0, max(duration - EXCERPT_LENGTH, 0.0) + 1e-9, SIMILARITY_WINDOW_HOP)
+        ends = np.minimum(starts + EXCERPT_LENGTH, duration)
+        vectors = window_vectors(y, sr, starts, ends, tempo)
+
+        new_records = np.zeros(len(starts), dtype=RECORD_DTYPE)
+        new_records["file_id"] = fid
+        new_records["last_modified"] = last_modified
+        new_records["start"] = starts
+        new_records["end"] = ends
+        new_records["vector"] = vectors
+
+        with index_lock():
+            # another process may have indexed the file while this one computed vectors
+            if is_indexed(fid, last_modified):
+                return 0
+            with open(PATHS_FILE, "a", encoding="UTF8") as f:
+                f.write(json.dumps({"id": fid, "path": file_path}) + "\n")
+            with open(VECTORS_FILE, "ab") as f:
+                f.write(new_records.tobytes())
+        return len(new_records)
+    except (OSError, ValueError) as e:
+        print(f"Similarity indexing failed: {e}")
+        return 0
+
+def is_indexed(fid: int, last_modified: float) -> bool:
+    """
+    Check if windows for this version of a file are already stored.
+    """
+    records = load_records()
+    return bool(np.any((records["file_id"] == fid) & (records["last_modified"] == last_modified)))
+
+@contextmanager
+def index_lock(timeout: float = 30.0):
+    """
+    Hold the index files across processes (server workers index concurrently).
+    A lock file created with O_EXCL, so it works the same on every OS.
+
+    Args:
+        timeout: Seconds to wait before giving up with TimeoutError
+    """
+    Path(SIMILARITY_FOLDER).mkdir(parents=True, exist_ok=True)
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            os.close(os.open(LOCK_FILE, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            break
+        except FileExistsError:
+            try:
+                if time.time() - LOCK_FILE.stat().st_mtime > LOCK_STALE_SECONDS:
+                    LOCK_FILE.unlink(missing_ok=True)
+                    continue
+            except FileNotFoundError:
+                continue
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Timed out waiting for {LOCK_FILE}")
+            time.sleep(0.05)
+    try:
+        yield
+    finally:
+        LOCK_FILE.unlink(missing_ok=True)
+
+def prune_windows() -> int:
+    """
+    Rewrite the index without windows of missing or modified files and
+    without duplicate windows. Drops the cluster index if anything changed,
+    since its row numbers would no longer line up.
+
+    Returns:
+        Number of windows removed
+    """
+    if not VECTORS_FILE.exists():
+        return 0
+    with index_lock():
+        records = np.array(load_records())
+        if len(records) == 0:
+            return 0
+        paths = load_paths()
+
+        mtimes = {}
+        for fid, file_path in paths.items():
+            mtimes[fid] = os.path.getmtime(file_path) if os.path.exists(file_path) else None
+        current = np.array([mtimes.get(int(fid)) == float(modified) for fid, modified
+                            in zip(records["file_id"], records["last_modified"])], dtype=bool)
+
+        # first row of each (file, version, start) wins
+        order = np.lexsort((records["start"], records["last_modified"], records["file_id"]))
+        ordered = records[order]
+        repeated = np.zeros(len(records), dtype=bool)
+        repeated[order[1:]] = ((ordered["file_id"][1:] == ordered["file_id"][:-1])
+                               & (ordered["last_modified"][1:] == ordered["last_modified"][:-1])
+                               & (ordered["start"][1:] == ordered["start"][:-1]))
+
+        keep = current & ~repeated
+        removed = int(len(records) - keep.sum())
+        if removed == 0:
+            return 0
+
+        kept = records[keep]
+        kept_ids = set(int(fid) for fid in np.unique(kept["file_id"]))
+        temp_file = VECTORS_FILE.with_suffix(".tmp")
+        kept.tofile(temp_file)
+        os.replace(temp_file, VECTORS_FILE)
+        temp_file = PATHS_FILE.with_suffix(".tmp")
+        with open(temp_file, "w", encoding="UTF8") as f:
+            for fid in sorted(kept_ids):
+                f.write(json.dumps({"id": fid, "path": paths[fid]}) + "\n")
+        os.replace(temp_file, PATHS_FILE)
+        CLUSTERS_FILE.unlink(missing_ok=True)
+        return removed
+
+def load_records() -> np.ndarray:
+    """
+    Memory-map the window records (ignores a partly written last record).
+
+    Returns:
+        Structured array of RECORD_DTYPE
+    """
+    if not VECTORS_FILE.exists():
+        return np.zeros(0, dtype=RECORD_DTYPE)
+    count = VECTORS_FILE.stat().st_size // RECORD_DTYPE.itemsize
+    if count == 0:
+        return np.zeros(0, dtype=RECORD_DTYPE)
+    return np.memmap(VECTORS_FILE, dtype=RECORD_DTYPE, mode="r", shape=(count,))
+
+def load_paths() -> dict:
+    """
+    Map file ids back to paths.
+    """
+    paths = {}
+    if PATHS_FILE.exists():
+        with open(PATHS_FILE, "r", encoding="UTF8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                paths[entry["id"]] = entry["path"]
+    return paths
+
+def excerpt_vector(file_path: str, start: float, end: float,
+                   tempo: Optional[float] = None) -> np.ndarray:
+    """
+    Summary vector for one excerpt, decoding only that part of the file.
+
+    Args:
+        file_path: Path to audio file
+        start: Excerpt start in seconds
+        end: Excerpt end in seconds
+        tempo: The file's detected BPM, as used for its indexed windows
+            (estimated from the excerpt if unknown)
+
+    Returns:
+        Unit-length float32 vector
+    """
+    y, sr = librosa.load(file_path, sr=None, mono=True, offset=start, duration=end - start)
+    return window_vectors(y, sr, np.array([0.0]), np.array([len(y) / sr]), tempo)[0]
+
+def find_similar(query: np.ndarray, k: int = SIMILARITY_TOP_K,
+                 exclude: Optional[tuple] = None, nprobe: int = 8) -> list[dict]:
+    """
+    Top-k excerpt windows by cosine similarity to a query vector.
+    Uses the cluster index if one was built, otherwise scans every window.
+
+    Args:
+        query: Vector from excerpt_vector()
+        k: Number of results
+        exclude: (file_path, start, end) excerpt whose overlapping windows are skipped
+        nprobe: Clusters searched when the cluster index is used
+
+    Returns:
+        List of dicts with file_path, start_time, end_time, score (best first)
+    """
+    records = load_records()
+    if len(records) == 0:
+        return []
+    query = query.astype(np.float32)
+
+    rows = candidate_rows(query, len(records), nprobe)
+    vectors = records["vector"]
+    if rows is None:
+        scores = np.concatenate([
+            vectors[i:i + CHUNK_ROWS].astype(np.float32) @ query
+            for i in range(0, len(records), CHUNK_ROWS)
+        ])
+        rows = np.arange(len(records))
+    else:
+        scores = vectors[rows].astype(np.float32) @ query
+
+    paths = load_paths()
+    exclude_id = file_id(exclude[0]) if exclude else None
+    mtimes = {}
+    results = []
+    # look a bit past k so excluded/outdated windows don't leave the list short
+    for index in _ranked(scores, k * 4):
+        record = records[rows[index]]
+        fid = int(record["file_id"])
+        start, end = float(record["start"]), float(record["end"])
+        if fid == exclude_id and start < exclude[2] and end > exclude[1]:
+            continue
+        file_path = paths.get(fid)
+        if file_path is None:
+            continue
+        if file_path not in mtimes:
+            mtimes[file_path] = os.path.getmtime(file_path) if os.path.exists(file_path) else None
+        if mtimes[file_path] != float(record["last_modified"]):
+            continue
+        results.append({"file_path": file_path, "start_time": start,
+                        "end_time": end, "score": float(scores[index])})
+        if len(results) == k:
+            break
+    return results
+
+def _ranked(scores: np.ndarray, first: int):
+    """Yield indices by descending score, only fully sorting if more than `first` are needed."""
+    if first >= len(scores):
+        yield from np.argsort(-scores)
+        return
+    head = np.argpartition(-scores, first)[:first]
+    yield from head[np.argsort(-scores[head])]
+    rest = np.ones(len(scores), dtype=bool)
+    rest[head] = False
+    rest = np.flatnonzero(rest)
+    yield from rest[np.argsort(-scores[rest])]
+
+def candidate_rows(query: np.ndarray, total_rows: int, nprobe: int) -> Optional[np.ndarray]:
+    """
+    Rows in the nprobe clusters nearest the query, plus rows added since the
+    index was built. None if there's no cluster index.
+    """
+    if not CLUSTERS_FILE.exists():
+        return None
+    with np.load(CLUSTERS_FILE) as data:
+        centroids = data["centroids"]
+        order = data["order"]
+        offsets = data["offsets"]
+        built_rows = int(data["built_rows"])
+    if built_rows > total_rows:
+        # windows file was replaced since the index was built
+        return None
+
+    nearest = np.argsort(-(centroids @ query))[:nprobe]
+    rows = [order[offsets[c]:offsets[c + 1]] for c in nearest]
+    rows.append(np.arange(built_rows, total_rows))
+    return np.concatenate(rows)
+
+def build_cluster_index(n_clusters: Optional[int] = None, iterations: int = 10,
+                        sample_size: int = 50000, seed: int = 0) -> int:
+    """
+    Build a coarse k-means index (spherical, on unit vectors) over all windows.
+
+    Args:
+        n_clusters: Number of clusters, defaults to sqrt(windows)
+        iterations: k-means iterations
+        sample_size: Windows used to train the centroids
+        seed: Random seed
+
+    Returns:
+        Number of clusters built
+    """
+    records = load_records()
+    total = len(records)
+    if total == 0:
+        return 0
+    n_clusters = n_clusters or max(1, int(np.sqrt(total)))
+    rng = np.random.default_rng(seed)
+    vectors = records["vector"]
+
+    sample = vectors[np.sort(rng.choice(total, min(sample_size, total), replace=False))]
+    sample = sample.astype(np.float32)
+    centroids = sample[rng.choice(len(sample), min(n_clusters, len(sample)), replace=False)]
+    for _ in range(iterations):
+        labels = np.argmax(sample @ centroids.T, axis=1)
+        for c in range(len(centroids)):
+            members = sample[labels == c]
+            if len(members):
+                centroids[c] = members.mean(axis=0)
+        centroids = _unit(centroids)
+
+    labels = np.concatenate([
+        np.argmax(vectors[i:i + CHUNK_ROWS].astype(np.float32) @ centroids.T, axis=1)
+        for i in range(0, total, CHUNK_ROWS)
+    ])
+    order = np.argsort(labels, kind="stable")
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(labels, minlength=len(centroids)))])
+    np.savez(CLUSTERS_FILE, centroids=centroids.astype(np.float32), order=order,
+             offsets=offsets, built_rows=total)
+    return len(centroids)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Similar excerpt index tools")
+    parser.add_argument("--build-index", action="store_true", help="build the cluster index")
+    parser.add_argument("--clusters", type=int, default=None)
+    args = parser.parse_args()
+    if args.build_index:
+        built = build_cluster_index(args.clusters)
+        print(f"Built {built} clusters over {len(load_records())} windows")
+    else:
+        print(f"{len(load_records())} windows indexed")